@@ -0,0 +1,123 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import span
+
+# --- Answer cache settings ---
+SIMILARITY_THRESHOLD = 0.95  # cosine similarity needed to reuse an answer for a rephrased question
+MAX_ENTRIES = 512
+TTL_SECONDS = 24 * 3600
+
+
+def normalize_question(question):
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+class AnswerCache:
+    """Process-wide LRU/TTL cache of answers keyed by normalized question text.
+
+    Exact (normalized) matches are free. When an embedder is given, a miss falls
+    back to cosine similarity against cached questions, so close rephrasings
+    reuse an earlier answer. Entries belong to a namespace (the corpus key) and
+    are dropped as soon as the namespace changes. `embed` returns the question's
+    embedding, computed at most once per question, so the retriever can reuse it.
+    """
+
+    def __init__(self, embedding=None, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.embedding = embedding
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = None
+        self.stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+        self._entries = OrderedDict()  # normalized question -> (answer, unit vector or None, stored at)
+        self._vectors = OrderedDict()  # normalized question -> query embedding, for lookups that missed
+        self._lock = threading.Lock()
+
+    def set_namespace(self, namespace):
+        with self._lock:
+            if namespace != self.namespace:
+                self.namespace = namespace
+                self._entries.clear()
+                self._vectors.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def embed(self, question):
+        """The embedding of `question` (as returned by embed_query), or None without an embedder."""
+        if self.embedding is None:
+            return None
+        key = normalize_question(question)
+        with self._lock:
+            vector = self._vectors.get(key)
+        if vector is None:
+            with span("embed_query"):
+                vector = self.embedding.embed_query(question)
+            with self._lock:
+                self._vectors[key] = vector
+                while len(self._vectors) > self.max_entries:
+                    self._vectors.popitem(last=False)
+        return vector
+
+    def _unit(self, question):
+        vector = np.asarray(self.embed(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self, now):
+        expired = [k for k, (_, _, stored) in self._entries.items() if now - stored > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, question):
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry[0]
+            candidates = [(k, v) for k, (_, v, _) in self._entries.items() if v is not None]
+        if self.embedding is None or not candidates:
+            return self._miss()
+
+        vector = self._unit(question)
+        matrix = np.stack([v for _, v in candidates])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return self._miss()
+        with self._lock:
+            entry = self._entries.get(candidates[best][0])
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(candidates[best][0])
+            self.stats["similar_hits"] += 1
+            return entry[0]
+
+    def _miss(self):
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, question, answer):
+        key = normalize_question(question)
+        vector = self._unit(question) if self.embedding is not None else None
+        with self._lock:
+            self._entries[key] = (answer, vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,82 @@
+import argparse
+import base64
+import hashlib
+import os
+from functools import lru_cache
+
+from PIL import Image, features
+
+# --- Static assets ---
+# The background is downscaled and recompressed once, written to static/ with a
+# content hash in its name, and referenced from a single CSS variable instead of
+# inlining the 1.1 MB JPEG as base64 into the page on every rerun.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(APP_DIR, "static")
+BACKGROUND_SOURCE = os.path.join(APP_DIR, "mahitha_bg.jpeg")
+STYLESHEET = os.path.join(APP_DIR, "style.css")
+BACKGROUND_MAX_WIDTH = 1600
+BACKGROUND_QUALITY = 60
+PAYLOAD_BUDGET = 64 * 1024  # bytes of page CSS we are willing to send per rerun
+
+
+def prepare_background(source=BACKGROUND_SOURCE, static_dir=STATIC_DIR,
+                       max_width=BACKGROUND_MAX_WIDTH, quality=BACKGROUND_QUALITY):
+    """Write a downscaled WebP (or progressive JPEG) copy of the background and return its path."""
+    with open(source, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    webp = features.check("webp")
+    extension = "webp" if webp else "jpg"
+    name, _ = os.path.splitext(os.path.basename(source))
+    target = os.path.join(static_dir, f"{name}.{digest}.{max_width}.{extension}")
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(static_dir, exist_ok=True)
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        image.thumbnail((max_width, max_width * 4))
+        tmp_target = target + ".tmp"
+        if webp:
+            image.save(tmp_target, "WEBP", quality=quality, method=6)
+        else:
+            image.save(tmp_target, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(tmp_target, target)
+    return target
+
+
+def background_url(path, static_serving=True):
+    """URL for the background: Streamlit's static route, or an inline data URI as a fallback."""
+    if static_serving:
+        return f"app/static/{os.path.basename(path)}"
+    mime = "image/webp" if path.endswith(".webp") else "image/jpeg"
+    with open(path, "rb") as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode()}"
+
+
+@lru_cache(maxsize=4)
+def build_css(url, stylesheet=STYLESHEET):
+    with open(stylesheet, encoding="utf-8") as f:
+        rules = f.read()
+    return f'<style>\n:root {{ --app-bg: url("{url}"); }}\n{rules}</style>'
+
+
+def page_css(static_serving=True):
+    return build_css(background_url(prepare_background(), static_serving))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare static assets and check the page CSS payload size.")
+    parser.add_argument("--inline", action="store_true", help="measure the inline data-URI fallback")
+    args = parser.parse_args()
+
+    background = prepare_background()
+    css = page_css(static_serving=not args.inline)
+    original = os.path.getsize(BACKGROUND_SOURCE)
+    print(f"background: {original} -> {os.path.getsize(background)} bytes ({os.path.basename(background)})")
+    print(f"page CSS payload: {len(css.encode())} bytes (budget {PAYLOAD_BUDGET})")
+    if not args.inline and len(css.encode()) > PAYLOAD_BUDGET:
+        raise SystemExit("page CSS payload is over budget")
+
+
+if __name__ == "__main__":
+    main()
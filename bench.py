@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from langchain.chains import LLMChain
+from langchain.chains.combine_documents.stuff import StuffDocumentsChain
+
+from fakes import FakeLatencyEmbeddings, FakeStreamingChatModel
+from index_cache import index_dir
+from ingest import DOCUMENT_PATHS, sync_index
+from packing import CONTEXT_TOKEN_BUDGET, ContextAssembler
+from prompts import condense_prompt, custom_prompt
+from qa import ConversationalQA, percentile
+from retrieval import HybridRetriever, load_bm25
+from router import IntentRouter
+from tokens import count_tokens
+
+# --- Offline latency benchmark for the QA pipeline ---
+# Drives the same stages as app_faiss.py (ingest, index, route, condense,
+# retrieve, pack, generate) against fake models with simulated latency and
+# reports p50/p95/p99 per stage. Stage times are in milliseconds.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_PATH = os.path.join(APP_DIR, "bench_questions.json")
+BASELINE_PATH = os.path.join(APP_DIR, "bench_baseline.json")
+REGRESSION_TOLERANCE = 0.2  # fraction a p50 may grow over the baseline
+REGRESSION_MIN_DELTA = 2.0  # ms (or tokens) below which differences are noise
+# Higher-is-better counts, reported but never a regression (a drop shows up in prompt_tokens).
+UNGATED_STAGES = {"context_tokens_saved"}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def add(self, name, value):
+        self.samples[name].append(value)
+
+    def timed(self, name, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        self.add(name, elapsed)
+        return elapsed
+
+    def summary(self):
+        return {
+            name: {
+                "count": len(values),
+                "mean": statistics.fmean(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+            for name, values in sorted(self.samples.items())
+        }
+
+
+def build_pipeline(embedding, llm, cache_dir, recorder, budget):
+    started = time.perf_counter()
+    vectorstore, stats = sync_index(embedding, DOCUMENT_PATHS, cache_dir=cache_dir, rebuild=True, workers=1)
+    recorder.timed("ingest_total", started)
+    recorder.add("ingest_parse", stats["parse_seconds"] * 1000)
+    recorder.add("ingest_embed", stats["embed_seconds"] * 1000)
+
+    retriever = HybridRetriever(vectorstore=vectorstore, bm25=load_bm25(index_dir(cache_dir), vectorstore), k=8)
+    question_generator = LLMChain(llm=llm, prompt=condense_prompt)
+    stuff_chain = StuffDocumentsChain(
+        llm_chain=LLMChain(llm=llm, prompt=custom_prompt),
+        document_variable_name="context"
+    )
+    return ConversationalQA(retriever, question_generator, stuff_chain, assembler=ContextAssembler(budget=budget))
+
+
+def run_session(qa_chain, router, questions, recorder):
+    turns = []
+    for question in questions:
+        started = time.perf_counter()
+        answer = router.route(question)
+        recorder.timed("route", started)
+        if answer is None:
+            started = time.perf_counter()
+            standalone, _ = qa_chain.condense(question, turns)
+            recorder.timed("condense", started)
+
+            started = time.perf_counter()
+            documents = qa_chain.retriever.invoke(standalone)
+            recorder.timed("retrieve", started)
+
+            started = time.perf_counter()
+            documents, report = qa_chain.assembler.assemble(documents)
+            recorder.timed("pack", started)
+            recorder.add("context_tokens_saved", report["tokens_saved"])
+            prompt = qa_chain.build_prompt(standalone, documents, turns)
+            recorder.add("prompt_tokens", count_tokens(prompt))
+
+            started = time.perf_counter()
+            parts = []
+            for token in qa_chain.stream_prompt(prompt):
+                if not parts:
+                    recorder.timed("first_token", started)
+                parts.append(token)
+            recorder.timed("generate", started)
+            answer = "".join(parts)
+        turns.append((question, answer))
+
+
+def run(args):
+    embedding = FakeLatencyEmbeddings(request_latency=args.embed_latency)
+    llm = FakeStreamingChatModel(first_token_latency=args.llm_first_token, token_latency=args.llm_token)
+    router = IntentRouter.from_file()
+    with open(args.questions, encoding="utf-8") as f:
+        sessions = json.load(f)
+
+    recorder = Recorder()
+    for _ in range(args.rounds):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            qa_chain = build_pipeline(embedding, llm, cache_dir, recorder, args.budget)
+            for questions in sessions:
+                started = time.perf_counter()
+                run_session(qa_chain, router, questions, recorder)
+                recorder.timed("session", started)
+    return {
+        "config": {
+            "rounds": args.rounds,
+            "sessions": len(sessions),
+            "embed_latency": args.embed_latency,
+            "llm_first_token": args.llm_first_token,
+            "llm_token": args.llm_token,
+            "budget": args.budget,
+        },
+        "stages": recorder.summary(),
+    }
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE, min_delta=REGRESSION_MIN_DELTA):
+    """Return a list of (stage, baseline p50, current p50) that regressed.
+
+    Every gated stage is lower-is-better: latencies in ms and prompt_tokens.
+    """
+    regressions = []
+    for name, current in results["stages"].items():
+        previous = baseline["stages"].get(name)
+        if previous is None or name in UNGATED_STAGES:
+            continue
+        if current["p50"] - previous["p50"] > max(min_delta, tolerance * previous["p50"]):
+            regressions.append((name, previous["p50"], current["p50"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency benchmark for the portfolio QA pipeline.")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="JSON list of sessions (lists of questions)")
+    parser.add_argument("--rounds", type=int, default=3, help="cold-start rounds (ingest + all sessions)")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embeddings request")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="seconds to first LLM token")
+    parser.add_argument("--llm-token", type=float, default=0.01, help="seconds between LLM tokens")
+    parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET, help="context token budget")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with these results")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"{'stage':<22}{'p50':>10}{'p95':>10}{'p99':>10}{'n':>6}")
+    for name, stage in results["stages"].items():
+        print(f"{name:<22}{stage['p50']:>10.1f}{stage['p95']:>10.1f}{stage['p99']:>10.1f}{stage['count']:>6}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        for name, previous, current in regressions:
+            print(f"REGRESSION {name}: p50 {previous:.1f} -> {current:.1f}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
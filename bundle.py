@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from answer_cache import normalize_question
+from index_cache import CACHE_DIR, index_dir
+from packing import ContextAssembler
+from qa import FALLBACK_ANSWER, ConversationalQA, normalize_answer
+from resources import get_chains, get_embedding_backend, get_llm
+
+logger = logging.getLogger(__name__)
+
+# --- Precomputed answer bundle ---
+# Answers to the suggested and most frequent questions are baked offline by
+# running them through the full pipeline, and saved next to the index with the
+# corpus key, prompt and model they were produced with. The app serves them by
+# normalized question text before routing, so these questions cost no tokens
+# at request time. A bundle that no longer matches is ignored and rebaked.
+HOT_QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hot_questions.json")
+BUNDLE_VERSION = 1
+BUNDLE_FILE = "bundle.json"
+
+
+def bundle_path(cache_dir=CACHE_DIR):
+    return os.path.join(index_dir(cache_dir), BUNDLE_FILE)
+
+
+def read_questions(path=HOT_QUESTIONS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def bundle_settings(qa_chain, questions):
+    """Everything besides the corpus that shapes the baked answers."""
+    llm = qa_chain.combine_docs_chain.llm_chain.llm
+    prompt = qa_chain.combine_docs_chain.llm_chain.prompt
+    # Profiles fill the same template with a different name (see profiles.py).
+    prompt = json.dumps([prompt.template, prompt.partial_variables], sort_keys=True)
+    return {
+        "model": getattr(llm, "model_name", None) or type(llm).__name__,
+        "prompt": hashlib.sha256(prompt.encode()).hexdigest()[:16],
+        "questions": hashlib.sha256(json.dumps(sorted(questions)).encode()).hexdigest()[:16],
+    }
+
+
+class AnswerBundle:
+    """Read-only map of normalized question -> baked answer."""
+
+    def __init__(self, data=None):
+        self.data = data or {"answers": {}}
+        self.stats = {"hits": 0, "misses": 0}
+
+    @classmethod
+    def load(cls, corpus_key, settings, cache_dir=CACHE_DIR):
+        """Return the saved bundle if it matches this corpus and settings, else None."""
+        path = bundle_path(cache_dir)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if (data.get("version"), data.get("corpus_key"), data.get("settings")) != (BUNDLE_VERSION, corpus_key, settings):
+            return None
+        return cls(data)
+
+    def save(self, cache_dir=CACHE_DIR):
+        path = bundle_path(cache_dir)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.data["answers"])
+
+    def get(self, question):
+        entry = self.data["answers"].get(normalize_question(question))
+        self.stats["hits" if entry else "misses"] += 1
+        return entry["answer"] if entry else None
+
+
+def bake(router, qa_chain, questions, corpus_key, settings, fallback_answer=FALLBACK_ANSWER):
+    """Answer every question with the full pipeline (no history) and return the bundle."""
+    answers = {}
+    for question in questions:
+        started = time.perf_counter()
+        answer, documents, route = router.route(question), [], "canned"
+        if answer is None:
+            result = qa_chain.invoke(question, [])
+            answer, documents, route = result["answer"], result["source_documents"], "llm"
+            answer = normalize_answer(answer, fallback_answer)
+        answers[normalize_question(question)] = {
+            "question": question,
+            "answer": answer,
+            "route": route,
+            "sources": [
+                {key: d.metadata.get(key) for key in ("chunk_id", "source", "page", "page_end")} for d in documents
+            ],
+        }
+        logger.info("baked %r (%s) in %.2fs", question, route, time.perf_counter() - started)
+    return AnswerBundle({
+        "version": BUNDLE_VERSION,
+        "corpus_key": corpus_key,
+        "settings": settings,
+        "built_at": time.time(),
+        "answers": answers,
+    })
+
+
+def _bake_inputs(engine, questions_path):
+    questions = read_questions(questions_path)
+    # A separate chain so baking does not show up in the engine's request stats.
+    qa_chain = ConversationalQA(
+        engine.retriever, engine.qa.question_generator, engine.qa.combine_docs_chain,
+        assembler=ContextAssembler(budget=engine.qa.assembler.budget),
+    )
+    return questions, qa_chain, bundle_settings(qa_chain, questions)
+
+
+def rebake(engine, questions_path=HOT_QUESTIONS_PATH, cache_dir=CACHE_DIR):
+    """Bake, save and install a new bundle for the engine's corpus."""
+    started = time.perf_counter()
+    questions, qa_chain, settings = _bake_inputs(engine, questions_path)
+    bundle = bake(engine.router, qa_chain, questions, engine.corpus_key, settings, engine.fallback_answer)
+    bundle.save(cache_dir)
+    engine.bundle = bundle
+    logger.info("baked %d answers in %.1fs", len(bundle), time.perf_counter() - started)
+    return bundle
+
+
+def load_or_bake(engine, questions_path=HOT_QUESTIONS_PATH, cache_dir=CACHE_DIR, auto_bake=True):
+    """Install the saved bundle if it matches the engine's corpus and settings.
+
+    Otherwise, with auto_bake, a new one is baked on a daemon thread and the
+    engine keeps serving without a bundle until it is ready. Returns the
+    installed bundle or None.
+    """
+    _, qa_chain, settings = _bake_inputs(engine, questions_path)
+    bundle = AnswerBundle.load(engine.corpus_key, settings, cache_dir)
+    if bundle is not None:
+        engine.bundle = bundle
+    elif auto_bake:
+        threading.Thread(target=rebake, args=(engine, questions_path, cache_dir),
+                         name="bundle-bake", daemon=True).start()
+    return bundle
+
+
+def main():
+    # profiles imports engine, which imports this module to install the bundle, so import it lazily here.
+    from profiles import DEFAULT_PROFILE, engine_factory, read_profile
+
+    parser = argparse.ArgumentParser(description="Bake answers to a profile's hot questions for its current corpus.")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE)
+    parser.add_argument("--questions", default=None, help="default: the profile's hot_questions file")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--force", action="store_true", help="rebake even if the saved bundle is current")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    profile = read_profile(args.profile)
+    questions_path = args.questions or profile["hot_questions"]
+    if not questions_path:
+        parser.error(f"profile {args.profile!r} has no hot_questions; pass --questions")
+    api_key = os.environ.get("OPENAI_API_KEY")
+    embedding = get_embedding_backend(api_key)
+    question_generator, _ = get_chains(api_key)
+    build_engine = engine_factory(embedding, question_generator, get_llm(api_key), None,
+                                  cache_dir=args.cache_dir, bake_bundle=False)
+    engine = build_engine(dict(profile, hot_questions=questions_path))
+    started = time.perf_counter()
+    bundle = load_or_bake(engine, questions_path, engine.cache_dir, auto_bake=False)
+    if bundle is None or args.force:
+        bundle = rebake(engine, questions_path, engine.cache_dir)
+    print(f"{len(bundle)} answers for {args.profile} corpus {engine.corpus_key[:12]} in "
+          f"{bundle_path(engine.cache_dir)} ({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
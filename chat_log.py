@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import time
+import uuid
+from array import array
+from collections import OrderedDict, deque
+
+# --- Displayed chat history ---
+# What the page shows, as opposed to what the LLM sees (memory.py). Turns live
+# in a ring buffer per session; turns pushed out of it are appended to an
+# optional JSONL overflow file so "Load older" can still reach them. Each turn's
+# markdown is built once when it is added, and the page renders one markdown
+# element per page of turns, so a rerun costs the same however long the
+# session has run.
+#
+# Pages are numbered from the oldest turn, so every page but the newest is
+# complete and never changes; their joined markdown is cached.
+HISTORY_DISPLAY_TURNS = 200  # turns kept in memory per session
+HISTORY_PAGE_TURNS = 10
+PAGE_CACHE_SIZE = 8  # rendered full pages kept per session
+CHAT_LOG_DIR = os.environ.get("CHAT_LOG_DIR")  # where overflowed turns are kept; unset drops them
+
+
+def render_turn(question, answer):
+    """Markdown for one turn, newest message first like the rest of the page."""
+    return f"**📄 Answer:** {answer}\n\n**🧑 You:** {question}"
+
+
+class ChatLog:
+    """Per-session display history: ring buffer, optional overflow file and paged rendering.
+
+    Keep one in st.session_state. Turn n (0 = oldest ever added) belongs to
+    page n // page_size; `render_pages(count)` returns the newest page plus
+    `count` older ones, newest first.
+    """
+
+    def __init__(self, capacity=HISTORY_DISPLAY_TURNS, page_size=HISTORY_PAGE_TURNS, overflow_dir=CHAT_LOG_DIR):
+        self.capacity = capacity
+        self.page_size = page_size
+        self.overflow_dir = overflow_dir
+        self.overflow_path = None
+        self.stats = {"renders": 0, "page_cache_hits": 0, "overflow_reads": 0, "dropped": 0}
+        self._reset()
+
+    def _reset(self):
+        self._turns = deque(maxlen=self.capacity)  # rendered markdown, oldest first
+        self._first = 0  # index of the oldest turn still in memory
+        self._offsets = array("q")  # byte offset of each overflowed turn in the overflow file
+        self._pages = OrderedDict()  # page number -> joined markdown, full pages only
+
+    def __len__(self):
+        """Turns added since the last clear, including overflowed and dropped ones."""
+        return self._first + len(self._turns)
+
+    def add(self, question, answer):
+        if len(self._turns) == self.capacity:
+            self._overflow(self._turns[0])
+            self._first += 1
+        self._turns.append(render_turn(question, answer))
+        self.stats["renders"] += 1
+
+    def clear(self):
+        if self.overflow_path and os.path.exists(self.overflow_path):
+            os.remove(self.overflow_path)
+        self.overflow_path = None
+        self._reset()
+
+    def _overflow(self, markdown):
+        if self.overflow_dir is None:
+            self.stats["dropped"] += 1
+            return
+        if self.overflow_path is None:
+            os.makedirs(self.overflow_dir, exist_ok=True)
+            self.overflow_path = os.path.join(self.overflow_dir, f"{uuid.uuid4().hex}.jsonl")
+        with open(self.overflow_path, "ab") as f:
+            self._offsets.append(f.tell())
+            f.write(json.dumps(markdown).encode() + b"\n")
+
+    def _oldest_available(self):
+        return self._first - len(self._offsets)
+
+    def _read_overflow(self, start, stop):
+        """Turns [start, stop) from the overflow file, in one seek and read."""
+        base = self._oldest_available()
+        self.stats["overflow_reads"] += 1
+        with open(self.overflow_path, "rb") as f:
+            f.seek(self._offsets[start - base])
+            return [json.loads(f.readline()) for _ in range(stop - start)]
+
+    def _turn_range(self, start, stop):
+        start = max(start, self._oldest_available())
+        turns = []
+        if start < self._first:
+            turns += self._read_overflow(start, min(stop, self._first))
+        turns += [self._turns[i - self._first] for i in range(max(start, self._first), stop)]
+        return turns
+
+    def _render_page(self, page):
+        start, stop = page * self.page_size, min((page + 1) * self.page_size, len(self))
+        full = stop - start == self.page_size
+        if full and page in self._pages:
+            self._pages.move_to_end(page)
+            self.stats["page_cache_hits"] += 1
+            return self._pages[page]
+        markdown = "\n\n".join(reversed(self._turn_range(start, stop)))
+        if full and start >= self._oldest_available():
+            self._pages[page] = markdown
+            if len(self._pages) > PAGE_CACHE_SIZE:
+                self._pages.popitem(last=False)
+        return markdown
+
+    def _page_span(self, count):
+        """(newest, oldest) page numbers to show; a partial newest page brings one more along."""
+        newest = (len(self) - 1) // self.page_size
+        extra = 1 if len(self) % self.page_size else 0
+        return newest, max(newest - count - extra, 0)
+
+    def render_pages(self, count=0):
+        """Markdown for the newest page(s) and `count` older pages, newest first.
+
+        At least `page_size` turns are shown when there are that many.
+        """
+        if not len(self):
+            return []
+        newest, oldest = self._page_span(count)
+        oldest = max(oldest, self._oldest_available() // self.page_size)
+        return [markdown for markdown in map(self._render_page, range(newest, oldest - 1, -1)) if markdown]
+
+    def has_older(self, count=0):
+        """Whether turns older than those shown by render_pages(count) can still be loaded."""
+        if not len(self):
+            return False
+        _, oldest = self._page_span(count)
+        return oldest * self.page_size > self._oldest_available()
+
+
+# --- Measurement: rerun time vs session length, per-message rendering vs ChatLog ---
+def _per_message_page():
+    import streamlit as st
+
+    for role, msg in st.session_state.history:
+        st.markdown(f"**{role}:** {msg}")
+
+
+def _paged_page():
+    import streamlit as st
+
+    for markdown in st.session_state.chat_log.render_pages(st.session_state.get("older_pages", 0)):
+        st.markdown(markdown)
+
+
+def main():
+    from streamlit.testing.v1 import AppTest
+
+    parser = argparse.ArgumentParser(description="Time Streamlit reruns as the chat history grows.")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args()
+
+    answer = ("Mahitha is a software engineer with experience in Python, Java, SQL and cloud platforms. "
+              "She enjoys building data-driven applications and is always learning new tools.")
+    print(f"{'turns':>6} {'per-message ms':>15} {'elements':>9} {'paged ms':>9} {'elements':>9}")
+    for turns in args.turns:
+        row = []
+        for script in (_per_message_page, _paged_page):
+            at = AppTest.from_function(script, default_timeout=60)
+            history, chat_log = [], ChatLog(overflow_dir=None)
+            for i in range(turns):
+                history.insert(0, ("🧑 You", f"Question {i}?"))
+                history.insert(0, ("📄 Answer", answer))
+                chat_log.add(f"Question {i}?", answer)
+            at.session_state["history"] = history
+            at.session_state["chat_log"] = chat_log
+            at.run()
+            started = time.perf_counter()
+            for _ in range(args.reruns):
+                at.run()
+            row += [(time.perf_counter() - started) * 1000 / args.reruns, len(at.markdown)]
+        print(f"{turns:>6} {row[0]:>15.1f} {row[1]:>9} {row[2]:>9.1f} {row[3]:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from index_cache import CACHE_DIR, check_embedding, embedding_model_name, index_dir, load_index, save_index
+from resources import get_embedding_backend
+
+logger = logging.getLogger(__name__)
+
+# --- Compact, memory-mapped index ---
+# .index_cache/index/compact/vectors.faiss   IVF index; inverted lists are mmapped
+# .index_cache/index/compact/docstore.bin    chunk records (JSON) back to back
+# .index_cache/index/compact/offsets.npy     record start offsets, one per vector + end
+# .index_cache/index/compact/ids.npy         chunk id per vector position
+# .index_cache/index/compact/lookup.npy      chunk ids sorted, with their positions
+# .index_cache/index/compact/compact.json    corpus key, quantization and recall
+# Everything is read through mmap, so worker processes share one copy in the
+# page cache instead of each unpickling its own index and Document objects.
+# It is exported from the exact index after every ingest and is read-only.
+QUANTIZATIONS = ("none", "fp16", "pq")
+MIN_TRAINING_POINTS = 39  # per centroid, below which faiss k-means warns
+PQ_SUBVECTOR_DIMS = 16  # dimensions per product-quantizer code (1536 -> 96 bytes/vector)
+NPROBE = 32  # inverted lists searched per query
+RECALL_K = 10
+RECALL_QUERIES = 200
+MIN_RECALL = 0.9  # warn when the quantized index finds fewer of the exact top-k
+
+
+def compact_dir(cache_dir=CACHE_DIR):
+    return os.path.join(index_dir(cache_dir), "compact")
+
+
+class CompactDocstore(Docstore):
+    """Read-only docstore over an offset-indexed file of JSON records."""
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, "docstore.bin"), "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        self.offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(folder, "ids.npy"), mmap_mode="r")
+        lookup = np.load(os.path.join(folder, "lookup.npy"), mmap_mode="r")
+        self._sorted_ids, self._positions = lookup["id"], lookup["position"]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def document_at(self, position):
+        record = json.loads(self._data[int(self.offsets[position]):int(self.offsets[position + 1])])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def search(self, search):
+        key = search.encode()
+        i = int(np.searchsorted(self._sorted_ids, key))
+        if i == len(self._sorted_ids) or self._sorted_ids[i] != key:
+            return f"ID {search} not found."
+        return self.document_at(int(self._positions[i]))
+
+    def add(self, texts):
+        raise ValueError("The compact docstore is read-only; re-run ingest.py to change the index.")
+
+    def delete(self, ids):
+        raise ValueError("The compact docstore is read-only; re-run ingest.py to change the index.")
+
+
+class PositionIds(Mapping):
+    """index_to_docstore_id backed by the mmapped ids array instead of a dict."""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self.ids):
+            raise KeyError(position)
+        return self.ids[position].decode()
+
+    def __iter__(self):
+        return iter(range(len(self.ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def build_ivf(vectors, quantization="none"):
+    """Train and fill an IVF index over the vectors with the requested code type."""
+    count, dim = vectors.shape
+    nlist = max(1, min(int(math.sqrt(count)), count // MIN_TRAINING_POINTS))
+    pq_bits = min(8, int(math.log2(count / MIN_TRAINING_POINTS))) if count >= 2 * MIN_TRAINING_POINTS else 0
+    if quantization == "pq" and (not pq_bits or dim % PQ_SUBVECTOR_DIMS):
+        logger.warning("%d vectors of %d dims are too few for PQ; using fp16 instead", count, dim)
+        quantization = "fp16"
+    quantizer = faiss.IndexFlatL2(dim)
+    if quantization == "pq":
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, dim // PQ_SUBVECTOR_DIMS, pq_bits)
+    elif quantization == "fp16":
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_fp16)
+    else:
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    if nlist == 1:
+        # A single list needs no k-means; seeding the centroid skips faiss's small-sample warning.
+        quantizer.add(vectors.mean(axis=0, keepdims=True))
+    index.train(vectors)
+    index.add(vectors)
+    index.nprobe = min(NPROBE, nlist)
+    return index, quantization
+
+
+def recall_at_k(exact_index, index, queries, k=RECALL_K):
+    """Fraction of the exact top-k neighbours that the (approximate) index also returns."""
+    k = min(k, exact_index.ntotal)
+    _, expected = exact_index.search(queries, k)
+    _, found = index.search(queries, k)
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / expected.size if expected.size else 1.0
+
+
+def export_compact(vectorstore, corpus_key, cache_dir=CACHE_DIR, quantization="none"):
+    """Write the compact index for an exact FAISS vector store; returns compact.json's contents."""
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"quantization must be one of {QUANTIZATIONS}, not {quantization!r}.")
+    started = time.perf_counter()
+    folder = compact_dir(cache_dir)
+    tmp_folder = f"{folder}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+
+    count = vectorstore.index.ntotal
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(count)]
+    offsets = [0]
+    with open(os.path.join(tmp_folder, "docstore.bin"), "wb") as f:
+        for doc_id in ids:
+            document = vectorstore.docstore.search(doc_id)
+            f.write(json.dumps({"page_content": document.page_content, "metadata": document.metadata}).encode())
+            offsets.append(f.tell())
+    np.save(os.path.join(tmp_folder, "offsets.npy"), np.asarray(offsets, dtype=np.uint64))
+    id_array = np.asarray([doc_id.encode() for doc_id in ids], dtype=f"S{max(map(len, ids), default=1)}")
+    np.save(os.path.join(tmp_folder, "ids.npy"), id_array)
+    order = np.argsort(id_array, kind="stable")
+    lookup = np.empty(count, dtype=[("id", id_array.dtype), ("position", np.uint32)])
+    lookup["id"], lookup["position"] = id_array[order], order
+    np.save(os.path.join(tmp_folder, "lookup.npy"), lookup)
+
+    vectors = vectorstore.index.reconstruct_n(0, count)
+    requested = quantization
+    index, quantization = build_ivf(vectors, quantization)
+    faiss.write_index(index, os.path.join(tmp_folder, "vectors.faiss"))
+    sample = vectors[np.random.default_rng(0).permutation(count)[:RECALL_QUERIES]]
+    recall = recall_at_k(vectorstore.index, index, sample)
+    if recall < MIN_RECALL:
+        logger.warning("compact index recall@%d is %.3f (quantization=%s)", RECALL_K, recall, quantization)
+    info = {
+        "corpus_key": corpus_key,
+        "model": embedding_model_name(vectorstore.embeddings),
+        "requested": requested,
+        "quantization": quantization,
+        "count": count,
+        "nlist": index.nlist,
+        "nprobe": index.nprobe,
+        f"recall@{RECALL_K}": recall,
+        "bytes": sum(os.path.getsize(os.path.join(tmp_folder, name)) for name in os.listdir(tmp_folder)),
+    }
+    with open(os.path.join(tmp_folder, "compact.json"), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=1)
+    # Processes still mapping the old files keep reading them until they reload.
+    shutil.rmtree(folder, ignore_errors=True)
+    try:
+        os.replace(tmp_folder, folder)
+    except OSError:
+        # Another worker exported the same corpus at the same time; keep its copy.
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+    logger.info("exported compact index (%s, %d vectors) in %.2fs", quantization, count,
+                time.perf_counter() - started)
+    return info
+
+
+def read_compact_info(cache_dir=CACHE_DIR):
+    path = os.path.join(compact_dir(cache_dir), "compact.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_compact(embedding, corpus_key, cache_dir=CACHE_DIR, quantization="none"):
+    """Open the compact index if it was exported for this corpus key and quantization, else None."""
+    info = read_compact_info(cache_dir)
+    if not info or info["corpus_key"] != corpus_key or info["requested"] != quantization:
+        return None
+    check_embedding(info["model"], embedding)
+    folder = compact_dir(cache_dir)
+    index = faiss.read_index(os.path.join(folder, "vectors.faiss"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    index.nprobe = info["nprobe"]
+    docstore = CompactDocstore(folder)
+    return FAISS(embedding, index, docstore, PositionIds(docstore.ids))
+
+
+# --- Measurement: load time and resident memory per worker ---
+def memory_mb():
+    """(resident, shared) megabytes of this process; shared counts file-backed pages like mmaps."""
+    try:
+        with open("/proc/self/statm") as f:
+            _, resident, shared = (int(v) for v in f.read().split()[:3])
+        page = os.sysconf("SC_PAGE_SIZE")
+        return resident * page / 1e6, shared * page / 1e6
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 0.0
+
+
+def _measure_worker(cache_dir, index_format, quantization, corpus_key, queries):
+    """Runs in a fresh interpreter: load one index format, search it, report time and memory."""
+    embedding = get_embedding_backend(backend=f"fake:{queries.shape[1]}")
+    resident_before, shared_before = memory_mb()
+    started = time.perf_counter()
+    if index_format == "exact":
+        vectorstore = load_index(embedding, cache_dir)
+    else:
+        vectorstore = load_compact(embedding, corpus_key, cache_dir, quantization)
+    load_seconds = time.perf_counter() - started
+    for query in queries:
+        vectorstore.similarity_search_by_vector(query.tolist(), k=RECALL_K)
+    resident, shared = memory_mb()
+    return {
+        "load_ms": load_seconds * 1000,
+        "rss_mb": resident - resident_before,
+        "private_mb": (resident - shared) - (resident_before - shared_before),
+    }
+
+
+def measure(cache_dir, index_format, quantization, corpus_key, queries):
+    script = (
+        "import json, sys, numpy as np; from compact_index import _measure_worker; "
+        "args = json.load(sys.stdin); "
+        "print(json.dumps(_measure_worker(args[0], args[1], args[2], args[3], np.asarray(args[4], dtype=np.float32))))"
+    )
+    payload = json.dumps([cache_dir, index_format, quantization, corpus_key, queries.tolist()])
+    output = subprocess.run([sys.executable, "-c", script], input=payload, check=True, capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def synthetic_store(vectorstore, count, cache_dir, noise=0.01, seed=0):
+    """Save an exact index of `count` synthetic chunks, for measuring at scale.
+
+    Vectors are random mixtures of the corpus vectors (plus a little noise), so
+    nearest neighbours stay well defined the way they are for real embeddings;
+    each reuses the text of its dominant corpus chunk.
+    """
+    rng = np.random.default_rng(seed)
+    base = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+    weights = rng.standard_normal((count, len(base))).astype(np.float32)
+    sources = np.abs(weights).argmax(axis=1)
+    vectors = weights @ base / math.sqrt(len(base))
+    vectors += noise * rng.standard_normal(vectors.shape, dtype=np.float32) * np.linalg.norm(base, axis=1).mean()
+    documents = {}
+    for i, source in enumerate(sources):
+        document = vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(source)])
+        documents[f"synthetic-{i}"] = Document(page_content=document.page_content,
+                                               metadata=dict(document.metadata, chunk_id=f"synthetic-{i}"))
+    index = faiss.IndexFlatL2(base.shape[1])
+    index.add(vectors)
+    store = FAISS(vectorstore.embeddings, index, InMemoryDocstore(documents), dict(enumerate(documents)))
+    save_index(store, cache_dir)
+    return store
+
+
+def main():
+    # ingest imports this module to export the compact index, so import it lazily here.
+    from ingest import DOCUMENT_PATHS, load_or_build_index
+
+    parser = argparse.ArgumentParser(description="Export the compact mmap index and compare it with the exact one.")
+    parser.add_argument("paths", nargs="*", default=DOCUMENT_PATHS)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--queries", type=int, default=20, help="searches per worker after loading")
+    parser.add_argument("--synthetic", type=int, default=0, help="scale the corpus to this many chunks first")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    load_dotenv()
+    embedding = get_embedding_backend()
+    vectorstore, key = load_or_build_index(embedding, args.paths, cache_dir=args.cache_dir, index_format="faiss")
+    if args.synthetic:
+        args.cache_dir = tempfile.mkdtemp(prefix="compact-bench-")
+        vectorstore, key = synthetic_store(vectorstore, args.synthetic, args.cache_dir), f"synthetic-{args.synthetic}"
+    queries = vectorstore.index.reconstruct_n(0, min(args.queries, vectorstore.index.ntotal))
+    print(f"{'format':>12} {'load ms':>9} {'RSS MB':>8} {'private MB':>11} {'disk MB':>8} {'recall@10':>10}")
+    exact = measure(args.cache_dir, "exact", "none", key, queries)
+    exact_bytes = sum(os.path.getsize(os.path.join(index_dir(args.cache_dir), name))
+                      for name in ("index.faiss", "index.pkl"))
+    print(f"{'exact':>12} {exact['load_ms']:9.1f} {exact['rss_mb']:8.1f} {exact['private_mb']:11.1f} "
+          f"{exact_bytes / 1e6:8.2f} {1.0:10.3f}")
+    for quantization in QUANTIZATIONS:
+        info = export_compact(vectorstore, key, args.cache_dir, quantization)
+        result = measure(args.cache_dir, "compact", quantization, key, queries)
+        print(f"{'mmap-' + info['quantization']:>12} {result['load_ms']:9.1f} {result['rss_mb']:8.1f} "
+              f"{result['private_mb']:11.1f} {info['bytes'] / 1e6:8.2f} {info[f'recall@{RECALL_K}']:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+
+from answer_cache import MAX_ENTRIES, SIMILARITY_THRESHOLD, TTL_SECONDS, AnswerCache, normalize_question
+from bundle import HOT_QUESTIONS_PATH, AnswerBundle, load_or_bake
+from index_cache import CACHE_DIR, index_dir
+from ingest import DOCUMENT_PATHS, load_or_build_index
+from metrics import MetricsRegistry, record_cache, set_route, span, start_trace
+from packing import CONTEXT_TOKEN_BUDGET, ContextAssembler
+from qa import FALLBACK_ANSWER, ConversationalQA, normalize_answer
+from retrieval import HybridRetriever, load_bm25
+from router import INTENTS_PATH, IntentRouter
+
+logger = logging.getLogger(__name__)
+
+# --- Portfolio QA engine ---
+# The whole question-answering pipeline without a UI, shared by the Streamlit
+# app and the HTTP service (server.py). Settings can be overridden through the
+# same environment variables in both.
+MAX_LLM_CALLS = 8  # LLM requests in flight per process in the async path
+BUNDLE_AUTO_BAKE = os.environ.get("BUNDLE_AUTO_BAKE", "1") != "0"  # rebake hot answers when the corpus changes
+RETRIEVAL_K = 8
+
+
+class QAEngine:
+    """Route, condense, cache, retrieve and answer questions about the portfolio.
+
+    `aask` is the async entry point: identical questions (same normalized text
+    and history) that arrive while one is being answered share its result
+    instead of calling the LLM again, and at most `max_llm_calls` LLM requests
+    run at once. Engines for different profiles (see profiles.py) can share one
+    `llm_limiter` so the limit holds for the whole process.
+    """
+
+    def __init__(self, embedding, question_generator, stuff_chain, paths=DOCUMENT_PATHS,
+                 cache_dir=CACHE_DIR, registry=None, max_llm_calls=MAX_LLM_CALLS, bake_bundle=BUNDLE_AUTO_BAKE,
+                 intents_path=INTENTS_PATH, questions_path=HOT_QUESTIONS_PATH, fallback_answer=FALLBACK_ANSWER,
+                 llm_limiter=None, root=None):
+        self.cache_dir = cache_dir
+        self.fallback_answer = fallback_answer
+        vectorstore, self.corpus_key = load_or_build_index(embedding, paths, cache_dir=cache_dir, root=root)
+        # BM25 + FAISS fused by rank; confident lexical matches skip the query embedding.
+        self.retriever = HybridRetriever(
+            vectorstore=vectorstore, bm25=load_bm25(index_dir(cache_dir), vectorstore), k=RETRIEVAL_K
+        )
+        # The optional embedding tier costs one embedding call per routed query.
+        self.router = IntentRouter.from_file(
+            intents_path, embedding=embedding if os.environ.get("INTENT_SEMANTIC") else None
+        ) if intents_path else IntentRouter([])
+        self.answer_cache = AnswerCache(
+            embedding,
+            threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", SIMILARITY_THRESHOLD)),
+            max_entries=int(os.environ.get("ANSWER_CACHE_SIZE", MAX_ENTRIES)),
+            ttl=float(os.environ.get("ANSWER_CACHE_TTL", TTL_SECONDS)),
+        )
+        self.answer_cache.set_namespace(self.corpus_key)
+        self.qa = ConversationalQA(
+            self.retriever, question_generator, stuff_chain,
+            assembler=ContextAssembler(budget=int(os.environ.get("CONTEXT_TOKEN_BUDGET", CONTEXT_TOKEN_BUDGET))),
+        )
+        self.registry = MetricsRegistry(log_path=os.environ.get("METRICS_LOG")) if registry is None else registry
+        self.max_llm_calls = max_llm_calls
+        self.stats = Counter()  # leaders / coalesced
+        self._llm_limiter = asyncio.Semaphore(max_llm_calls) if llm_limiter is None else llm_limiter
+        self._inflight = {}  # (normalized question, turns, summary) -> task answering it
+        # Baked answers to hot questions (see bundle.py), served before routing.
+        self.bundle = AnswerBundle()
+        if questions_path:
+            load_or_bake(self, questions_path, cache_dir, auto_bake=bake_bundle)
+
+    def ask(self, question, turns=()):
+        """Answer synchronously; returns (answer, finished trace)."""
+        with start_trace(question, self.registry) as trace:
+            answer = self.precomputed(question)
+            if answer is not None:
+                return answer, trace
+            answer = self.router.route(question)
+            if answer is not None:
+                set_route("canned")
+                return answer, trace
+            standalone_question, _ = self.qa.condense(question, turns)
+            answer = self.answer_cache.get(standalone_question)
+            record_cache("answer", answer is not None)
+            if answer is not None:
+                set_route("cache")
+                return answer, trace
+            set_route("llm")
+            # One embedding per question: the cache's lookup vector is reused for retrieval and put().
+            vector = self.answer_cache.embed(standalone_question)
+            answer = normalize_answer(self.qa.answer(standalone_question, turns, vector)[0], self.fallback_answer)
+            self.answer_cache.put(standalone_question, answer)
+            return answer, trace
+
+    async def aask(self, question, turns=()):
+        """Answer without blocking the event loop; returns (answer, finished trace)."""
+        key = (normalize_question(question), tuple(map(tuple, turns)), getattr(turns, "summary", ""))
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            with start_trace(question, self.registry) as trace:
+                set_route("coalesced")
+                # shield: a follower that disconnects must not cancel the shared request.
+                answer, _ = await asyncio.shield(task)
+            return answer, trace
+        self.stats["leaders"] += 1
+        task = asyncio.create_task(self._aanswer(question, turns))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _aanswer(self, question, turns):
+        with start_trace(question, self.registry) as trace:
+            answer = self.precomputed(question)
+            if answer is not None:
+                return answer, trace
+            if self.router.embedding is None:
+                answer = self.router.route(question)
+            else:
+                answer = await asyncio.to_thread(self.router.route, question)
+            if answer is not None:
+                set_route("canned")
+                return answer, trace
+            standalone_question, _ = await self.qa.acondense(question, turns, self._llm_limiter)
+            # The similarity lookup embeds the question with the synchronous client.
+            answer = await asyncio.to_thread(self.answer_cache.get, standalone_question)
+            record_cache("answer", answer is not None)
+            if answer is not None:
+                set_route("cache")
+                return answer, trace
+            set_route("llm")
+            vector = await asyncio.to_thread(self.answer_cache.embed, standalone_question)
+            answer, _ = await self.qa.aanswer(standalone_question, turns, self._llm_limiter, vector)
+            answer = normalize_answer(answer, self.fallback_answer)
+            await asyncio.to_thread(self.answer_cache.put, standalone_question, answer)
+            return answer, trace
+
+    def precomputed(self, question):
+        """The baked answer for a hot question, or None; records the "bundle" route on a hit."""
+        with span("bundle"):
+            answer = self.bundle.get(question)
+        if answer is not None:
+            set_route("bundle")
+        return answer
+
+    def snapshot(self):
+        """Process counters for debug panels and the service's /stats endpoint."""
+        return {
+            "corpus_key": self.corpus_key,
+            "engine": dict(self.stats),
+            "inflight": len(self._inflight),
+            "condense": dict(self.qa.stats),
+            "retrieval": dict(self.retriever.stats),
+            "bundle": dict(self.bundle.stats, answers=len(self.bundle)),
+            "answer_cache": self.answer_cache.stats,
+            "intents": dict(self.router.stats),
+            "context": self.qa.assembler.stats,
+        }
@@ -0,0 +1,73 @@
+import asyncio
+import re
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# --- Offline stand-ins for the OpenAI models ---
+FAKE_ANSWER = (
+    "Mahitha is a software engineer with experience in Python, Java, SQL and cloud platforms. "
+    "She enjoys building data-driven applications and is always learning new tools."
+)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Chat model that streams a canned answer word by word with simulated latency."""
+
+    response: str = FAKE_ANSWER
+    first_token_latency: float = 0.3  # seconds before the first token
+    token_latency: float = 0.02  # seconds between tokens
+
+    @property
+    def _llm_type(self):
+        return "fake-streaming-chat"
+
+    def _tokens(self):
+        return re.findall(r"\S+\s*", self.response)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens()
+        time.sleep(self.first_token_latency + self.token_latency * max(len(tokens) - 1, 0))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens()
+        await asyncio.sleep(self.first_token_latency + self.token_latency * max(len(tokens) - 1, 0))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic hash-seeded vectors; `model` names the size so indexes and caches keep sizes apart."""
+
+    @property
+    def model(self):
+        return f"fake-{self.size}"
+
+
+class FakeLatencyEmbeddings(FakeEmbeddings):
+    """Deterministic hash-seeded vectors with simulated request latency."""
+
+    size: int = 1536
+    request_latency: float = 0.1  # seconds per embeddings request
+    text_latency: float = 0.0  # additional seconds per text in the request
+
+    def embed_documents(self, texts):
+        time.sleep(self.request_latency + self.text_latency * len(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        time.sleep(self.request_latency + self.text_latency)
+        return super().embed_query(text)
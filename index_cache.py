@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_community.vectorstores import FAISS
+
+# --- Cache layout ---
+# .index_cache/index/index.faiss + index.pkl   live FAISS index and docstore
+# .index_cache/index/manifest.json             one entry per indexed chunk
+# .index_cache/index/compact/                  read-only mmap copy (see compact_index.py)
+# .index_cache/embeddings/<chunk hash>         per-chunk embedding vectors
+CACHE_DIR = os.environ.get("INDEX_CACHE_DIR", ".index_cache")
+INDEX_FORMAT = os.environ.get("INDEX_FORMAT", "faiss")  # "faiss" (pickled docstore) or "mmap"
+INDEX_QUANTIZATION = os.environ.get("INDEX_QUANTIZATION", "none")  # mmap only: none, fp16 or pq
+MANIFEST_VERSION = 1
+
+
+def index_dir(cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, "index")
+
+
+def embedding_model_name(embedding):
+    return getattr(embedding, "model", None) or type(embedding).__name__
+
+
+def corpus_key(paths, settings):
+    """Hash the document bytes together with everything that shapes the index."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_embeddings(embedding, cache_dir=CACHE_DIR):
+    """Wrap an embedder so chunk vectors are stored by content hash and reused across rebuilds."""
+    store = LocalFileStore(os.path.join(cache_dir, "embeddings"))
+    return CacheBackedEmbeddings.from_bytes_store(
+        embedding, store, namespace=embedding_model_name(embedding)
+    )
+
+
+def read_manifest(cache_dir=CACHE_DIR):
+    path = os.path.join(index_dir(cache_dir), "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(manifest, cache_dir=CACHE_DIR):
+    path = os.path.join(index_dir(cache_dir), "manifest.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(manifest, version=MANIFEST_VERSION), f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def check_embedding(recorded, embedding):
+    """Refuse to query an index with a different embedding backend than the one that built it."""
+    if recorded and recorded != embedding_model_name(embedding):
+        raise ValueError(
+            f"The index was built with embeddings {recorded!r} but queries would use "
+            f"{embedding_model_name(embedding)!r}; re-run ingest.py with the same EMBEDDING_BACKEND."
+        )
+
+
+def load_index(embedding, cache_dir=CACHE_DIR):
+    folder = index_dir(cache_dir)
+    if not os.path.exists(os.path.join(folder, "index.faiss")):
+        return None
+    manifest = read_manifest(cache_dir)
+    check_embedding(manifest and manifest["settings"]["model"], embedding)
+    # The docstore pickle is written by save_index below, so deserializing it is safe.
+    return FAISS.load_local(folder, embedding, allow_dangerous_deserialization=True)
+
+
+def save_index(vectorstore, cache_dir=CACHE_DIR):
+    vectorstore.save_local(index_dir(cache_dir))
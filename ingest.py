@@ -0,0 +1,438 @@
+import argparse
+import bisect
+import hashlib
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import fitz  # PyMuPDF
+from dotenv import load_dotenv
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+from compact_index import export_compact, load_compact
+from index_cache import (
+    CACHE_DIR,
+    INDEX_FORMAT,
+    INDEX_QUANTIZATION,
+    cached_embeddings,
+    corpus_key,
+    embedding_model_name,
+    index_dir,
+    load_index,
+    read_manifest,
+    save_index,
+    write_manifest,
+)
+from resources import get_embedding_backend
+from retrieval import bm25_path, build_bm25
+from tokens import count_tokens
+
+# --- Corpus settings ---
+DOCUMENT_PATHS = ["resume.pdf", "mahitha.pdf"]
+DOCUMENT_EXTENSIONS = (".pdf", ".txt", ".md")
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+
+
+def expand_paths(paths):
+    """Resolve files and directories into a sorted list of supported documents."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, n) for n in names if n.lower().endswith(DOCUMENT_EXTENSIONS)]
+        else:
+            files.append(path)
+    return sorted({os.path.normpath(f) for f in files})
+
+
+def source_name(path, root=None):
+    """A document's name in chunk metadata and vector ids: its path relative to the corpus root.
+
+    The root defaults to the working directory, which DOCUMENT_PATHS are relative
+    to; profiles set their own (see profiles.py). Whoever builds the index, the
+    same corpus gets the same sources, vector ids and manifest.
+    """
+    return os.path.relpath(path, root or os.curdir)
+
+
+# --- Utility: Stream text out of documents and chunk it incrementally ---
+def iter_pdf_pages(file_path):
+    with fitz.open(file_path) as doc:
+        for page_number, page in enumerate(doc, start=1):
+            yield page_number, page.get_text()
+
+
+def iter_text_pages(file_path, block_size=1 << 16):
+    # Plain-text documents have no pages; stream them as blocks of "page 1".
+    with open(file_path, encoding="utf-8") as f:
+        for block in iter(lambda: f.read(block_size), ""):
+            yield 1, block
+
+
+def iter_chunks(pages, source, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Chunk a stream of (page number, text) pairs with RecursiveCharacterTextSplitter semantics.
+
+    Only the unfinished tail of the text is buffered, so memory stays bounded by
+    roughly one page plus one chunk and total work is linear in document length.
+    Each Document carries source, page, page_end and its character offset.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    buffer = ""
+    buffer_offset = 0  # document offset of buffer[0]
+    page_offsets, page_numbers = [], []  # pages overlapping the buffer
+
+    def page_at(offset):
+        return page_numbers[max(bisect.bisect_right(page_offsets, offset) - 1, 0)]
+
+    def locate(chunks):
+        positions, search_from = [], 0
+        for chunk in chunks:
+            position = buffer.find(chunk, search_from)
+            if position < 0:
+                position = search_from
+            positions.append(position)
+            search_from = max(0, position + len(chunk) - chunk_overlap)
+        return positions
+
+    def make_document(chunk, position):
+        offset = buffer_offset + position
+        return Document(page_content=chunk, metadata={
+            "source": source,
+            "page": page_at(offset),
+            "page_end": page_at(offset + max(len(chunk) - 1, 0)),
+            "offset": offset,
+        })
+
+    for page_number, text in pages:
+        page_offsets.append(buffer_offset + len(buffer))
+        page_numbers.append(page_number)
+        buffer += text
+        if len(buffer) < 2 * chunk_size:
+            continue
+        chunks = splitter.split_text(buffer)
+        if len(chunks) < 2:
+            continue
+        positions = locate(chunks)
+        # The last chunk may still grow with the next page, so keep it buffered.
+        for chunk, position in zip(chunks[:-1], positions[:-1]):
+            yield make_document(chunk, position)
+        tail = positions[-1]
+        buffer = buffer[tail:]
+        buffer_offset += tail
+        keep = max(bisect.bisect_right(page_offsets, buffer_offset) - 1, 0)
+        del page_offsets[:keep], page_numbers[:keep]
+
+    if buffer.strip():
+        chunks = splitter.split_text(buffer)
+        for chunk, position in zip(chunks, locate(chunks)):
+            yield make_document(chunk, position)
+
+
+def iter_document_chunks(file_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, root=None):
+    source = source_name(file_path, root)
+    if file_path.lower().endswith(".pdf"):
+        pages = iter_pdf_pages(file_path)
+    else:
+        pages = iter_text_pages(file_path)
+    return iter_chunks(pages, source, chunk_size, chunk_overlap)
+
+
+def load_and_chunk_pdf(file_path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    return list(iter_chunks(iter_pdf_pages(file_path), source_name(file_path), chunk_size, chunk_overlap))
+
+
+def iter_corpus(paths=DOCUMENT_PATHS, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, root=None):
+    for path in expand_paths(paths):
+        yield from iter_document_chunks(path, chunk_size, chunk_overlap, root)
+
+
+def load_corpus(paths=DOCUMENT_PATHS, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, root=None):
+    return list(iter_corpus(paths, chunk_size, chunk_overlap, root))
+
+
+# --- Manifest: one entry per chunk, keyed by a stable vector id ---
+def _sha256(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def assign_chunk_ids(documents):
+    """Give each chunk a vector id derived from its source and content, and return manifest entries."""
+    entries = []
+    seen = {}
+    for document in documents:
+        source = document.metadata.get("source", "")
+        chunk_hash = _sha256(document.page_content)
+        base_id = _sha256(source, chunk_hash)[:32]
+        # Identical chunks inside one source still need distinct ids.
+        occurrence = seen.get(base_id, 0)
+        seen[base_id] = occurrence + 1
+        vector_id = base_id if occurrence == 0 else f"{base_id}-{occurrence}"
+        document.metadata["chunk_id"] = vector_id
+        entries.append({
+            "id": vector_id,
+            "source": source,
+            "pages": [document.metadata.get("page"), document.metadata.get("page_end")],
+            "hash": chunk_hash,
+        })
+    return entries
+
+
+def index_settings(embedding, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    return {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "model": embedding_model_name(embedding)}
+
+
+# --- Parallel parsing and batched embedding ---
+EMBED_BATCH_SIZE = 128  # chunks per embeddings request
+EMBED_BATCH_TOKENS = 100_000  # tokens per embeddings request
+EMBED_CONCURRENCY = 4  # embeddings requests in flight
+EMBED_RETRIES = 5
+EMBED_BACKOFF = 1.0  # seconds, doubled on every retry
+PARSE_POOL_MIN_FILES = 8  # below this, forking a pool costs more than parsing in-process
+
+
+def _chunk_file(job):
+    path, chunk_size, chunk_overlap, root = job
+    return list(iter_document_chunks(path, chunk_size, chunk_overlap, root))
+
+
+def parse_documents(files, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, workers=1, root=None):
+    """Extract and chunk files, in a process pool when workers > 1; PyMuPDF text extraction is CPU-bound.
+
+    workers=None uses every CPU, but only for PARSE_POOL_MIN_FILES files or more. The
+    default parses in-process: the app and server build indexes from inside a
+    multi-threaded process, where forking a pool is unsafe and slower for a few files.
+    """
+    jobs = [(path, chunk_size, chunk_overlap, root) for path in files]
+    if workers is None:
+        workers = os.cpu_count() or 1 if len(jobs) >= PARSE_POOL_MIN_FILES else 1
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        results = map(_chunk_file, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_chunk_file, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+    documents = []
+    for chunks in results:
+        documents += chunks
+    return documents
+
+
+def make_batches(texts, batch_size=EMBED_BATCH_SIZE, batch_tokens=EMBED_BATCH_TOKENS):
+    """Group texts into index ranges bounded by both chunk count and token count."""
+    batches, start, tokens = [], 0, 0
+    for i, text in enumerate(texts):
+        text_tokens = count_tokens(text)
+        if i > start and (i - start >= batch_size or tokens + text_tokens > batch_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += text_tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def _embed_with_retry(embedder, texts, retries=EMBED_RETRIES, backoff=EMBED_BACKOFF):
+    for attempt in range(retries + 1):
+        try:
+            return embedder.embed_documents(texts)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+
+def embed_in_batches(
+    embedder,
+    texts,
+    batch_size=EMBED_BATCH_SIZE,
+    batch_tokens=EMBED_BATCH_TOKENS,
+    concurrency=EMBED_CONCURRENCY,
+    retries=EMBED_RETRIES,
+    backoff=EMBED_BACKOFF,
+):
+    """Embed texts in size-bounded batches with bounded concurrency, preserving order."""
+    vectors = [None] * len(texts)
+    batches = make_batches(texts, batch_size, batch_tokens)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(_embed_with_retry, embedder, texts[start:end], retries, backoff): start
+            for start, end in batches
+        }
+        for future in as_completed(futures):
+            start = futures[future]
+            for offset, vector in enumerate(future.result()):
+                vectors[start + offset] = vector
+    return vectors
+
+
+def sync_index(
+    embedding,
+    paths=DOCUMENT_PATHS,
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    cache_dir=CACHE_DIR,
+    rebuild=False,
+    workers=1,
+    batch_size=EMBED_BATCH_SIZE,
+    concurrency=EMBED_CONCURRENCY,
+    root=None,
+):
+    """Bring the on-disk index in line with the documents, embedding only new chunks.
+
+    Sources are named relative to `root` (see source_name). Returns the vector
+    store and a dict of chunk counts and throughput figures.
+    """
+    files = expand_paths(paths)
+    settings = index_settings(embedding, chunk_size, chunk_overlap)
+    manifest = None if rebuild else read_manifest(cache_dir)
+    vectorstore = None
+    if manifest and manifest.get("settings") == settings:
+        vectorstore = load_index(embedding, cache_dir)
+
+    started = time.perf_counter()
+    documents = parse_documents(files, chunk_size, chunk_overlap, workers, root)
+    parse_seconds = time.perf_counter() - started
+    entries = assign_chunk_ids(documents)
+    known_ids = {e["id"] for e in manifest["chunks"]} if vectorstore is not None else set()
+    current_ids = {e["id"] for e in entries}
+    new_documents = [d for d in documents if d.metadata["chunk_id"] not in known_ids]
+    removed_ids = sorted(known_ids - current_ids)
+
+    texts = [d.page_content for d in new_documents]
+    started = time.perf_counter()
+    vectors = embed_in_batches(cached_embeddings(embedding, cache_dir), texts, batch_size, concurrency=concurrency)
+    embed_seconds = time.perf_counter() - started
+    text_embeddings = list(zip(texts, vectors))
+    metadatas = [d.metadata for d in new_documents]
+    ids = [d.metadata["chunk_id"] for d in new_documents]
+    if vectorstore is None:
+        if not documents:
+            raise ValueError("No document text found to index.")
+        vectorstore = FAISS.from_embeddings(text_embeddings, embedding, metadatas=metadatas, ids=ids)
+    else:
+        if removed_ids:
+            vectorstore.delete(removed_ids)
+        if new_documents:
+            vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+    save_index(vectorstore, cache_dir)
+    # The lexical index is cheap to rebuild in full over the current chunk set.
+    build_bm25(documents).save(bm25_path(index_dir(cache_dir)))
+    write_manifest({
+        "corpus_key": corpus_key(files, settings),
+        "settings": settings,
+        "chunks": entries,
+    }, cache_dir)
+    embedded_tokens = sum(count_tokens(text) for text in texts)
+    stats = {
+        "files": len(files),
+        "added": len(new_documents),
+        "removed": len(removed_ids),
+        "unchanged": len(documents) - len(new_documents),
+        "parse_seconds": parse_seconds,
+        "embed_seconds": embed_seconds,
+        "chunks_per_sec": len(texts) / embed_seconds if embed_seconds else 0.0,
+        "tokens_per_sec": embedded_tokens / embed_seconds if embed_seconds else 0.0,
+    }
+    return vectorstore, stats
+
+
+def corpus_fingerprint(paths=DOCUMENT_PATHS):
+    """Cheap stat-based fingerprint of the documents, for deciding when to reload the index."""
+    fingerprint = []
+    for path in expand_paths(paths):
+        stat = os.stat(path)
+        fingerprint.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprint)
+
+
+def load_or_build_index(
+    embedding,
+    paths=DOCUMENT_PATHS,
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    cache_dir=CACHE_DIR,
+    index_format=INDEX_FORMAT,
+    quantization=INDEX_QUANTIZATION,
+    root=None,
+):
+    """Load the index if the documents are unchanged, otherwise ingest the difference.
+
+    With index_format="mmap" the returned store is the read-only compact index,
+    exported from the exact one whenever it is missing or stale.
+    Returns the vector store and the corpus key it was built from.
+    """
+    files = expand_paths(paths)
+    manifest = read_manifest(cache_dir)
+    key = corpus_key(files, index_settings(embedding, chunk_size, chunk_overlap))
+    vectorstore = None
+    if manifest and manifest.get("corpus_key") == key:
+        if index_format == "mmap":
+            vectorstore = load_compact(embedding, key, cache_dir, quantization)
+            if vectorstore is not None:
+                return vectorstore, key
+        vectorstore = load_index(embedding, cache_dir)
+    if vectorstore is None:
+        vectorstore, _ = sync_index(embedding, files, chunk_size, chunk_overlap, cache_dir, root=root)
+    if index_format == "mmap":
+        export_compact(vectorstore, key, cache_dir, quantization)
+        vectorstore = load_compact(embedding, key, cache_dir, quantization)
+    return vectorstore, key
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally (re)index the portfolio documents.")
+    parser.add_argument("paths", nargs="*", help=f"PDF/text files or directories (default: {' '.join(DOCUMENT_PATHS)})")
+    parser.add_argument("--profile", help="index this profile's documents into its cache, as the app would")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="ignore the manifest and re-index everything")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (default: CPU count "
+                        f"for {PARSE_POOL_MIN_FILES}+ files)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks per embeddings request")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help="embeddings requests in flight")
+    args = parser.parse_args()
+
+    paths, cache_dir, root = args.paths or DOCUMENT_PATHS, args.cache_dir, None
+    if args.profile:
+        # Imported here: profiles builds engines, which import this module.
+        from profiles import profile_cache_dir, read_profile
+
+        if args.paths:
+            parser.error("--profile indexes the profile's documents; do not pass paths as well")
+        try:
+            profile = read_profile(args.profile)
+        except KeyError:
+            parser.error(f"unknown profile {args.profile!r}")
+        paths, cache_dir, root = profile["documents"], profile_cache_dir(args.profile, args.cache_dir), profile["root"]
+
+    load_dotenv()
+    embedding = get_embedding_backend()
+    _, stats = sync_index(
+        embedding,
+        paths,
+        cache_dir=cache_dir,
+        rebuild=args.rebuild,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        root=root,
+    )
+    print(f"{stats['files']} files: added {stats['added']}, removed {stats['removed']}, "
+          f"unchanged {stats['unchanged']} chunks")
+    print(f"parsed in {stats['parse_seconds']:.2f}s, embedded in {stats['embed_seconds']:.2f}s "
+          f"({stats['chunks_per_sec']:.1f} chunks/sec, {stats['tokens_per_sec']:.0f} tokens/sec)")
+    if INDEX_FORMAT == "mmap":
+        # Export the compact copy now rather than on the first app start.
+        load_or_build_index(embedding, paths, cache_dir=cache_dir, root=root)
+
+
+if __name__ == "__main__":
+    main()
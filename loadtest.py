@@ -0,0 +1,470 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import tornado.web
+
+from local_embeddings import HashedNgramEmbeddings
+from qa import percentile
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Concurrent-user load test against a stub OpenAI-compatible API ---
+# Starts a local stub for /v1/chat/completions (plain and SSE streaming) and
+# /v1/embeddings with configurable latency, token rate and injected errors,
+# points the OpenAI clients at it through OPENAI_BASE_URL, and replays the
+# conversations in bench_questions.json from N concurrent sessions, ramping N
+# up to find where throughput stops growing. Two serving modes:
+#
+#   streamlit  `streamlit run app_faiss.py`, each visitor a browser session
+#              spoken to over Streamlit's websocket protocol (page load, then
+#              one form submit per question)
+#   server     server.py, each visitor a series of POST /ask requests
+#
+# Both run in a subprocess; the stub and the visitors share this process's
+# event loops. The stub's vectors are not OpenAI's, so the index lives in its own cache dir.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_PATH = os.path.join(APP_DIR, "bench_questions.json")
+LOADTEST_CACHE_DIR = os.path.join(os.environ.get("INDEX_CACHE_DIR", ".index_cache"), "loadtest")
+STUB_WORDS = ("Mahitha has built data pipelines and web services in Python, Java and SQL on AWS and Azure, "
+              "and enjoys mentoring, hiking and learning new tools.").split()
+SATURATION_GAIN = 0.1  # a level must add this fraction of throughput to count as scaling
+
+
+# --- Stub OpenAI-compatible server ---
+class StubHandler(tornado.web.RequestHandler):
+    def initialize(self, settings, stats):
+        self.stub = settings
+        self.stats = stats
+
+    def prepare(self):
+        self.stats["inflight"] += 1
+        self.stats["max_inflight"] = max(self.stats["max_inflight"], self.stats["inflight"])
+
+    def on_finish(self):
+        self.stats["inflight"] -= 1
+
+    def on_connection_close(self):
+        self.stats["disconnects"] += 1
+
+    def inject_error(self):
+        """Fail the request with the configured status at the configured rate; True if it did."""
+        if random.random() >= self.stub["error_rate"]:
+            return False
+        self.stats["errors_injected"] += 1
+        self.set_status(self.stub["error_status"])
+        if self.stub["error_status"] == 429:
+            self.set_header("Retry-After", "0")
+        self.write({"error": {"message": "injected by loadtest stub", "type": "server_error", "code": None}})
+        return True
+
+
+class ChatCompletionsHandler(StubHandler):
+    async def post(self):
+        body = json.loads(self.request.body)
+        self.stats["chat"] += 1
+        await asyncio.sleep(self.stub["first_token_ms"] / 1000)
+        if self.inject_error():
+            return
+        prompt_tokens = sum(count_tokens(str(m.get("content") or "")) for m in body.get("messages", []))
+        words = [STUB_WORDS[i % len(STUB_WORDS)] for i in range(self.stub["completion_tokens"])]
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += len(words)
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model")}
+        if not body.get("stream"):
+            await asyncio.sleep(len(words) / self.stub["tokens_per_second"])
+            message = {"role": "assistant", "content": " ".join(words)}
+            self.write(dict(base, object="chat.completion", usage=usage,
+                            choices=[{"index": 0, "message": message, "finish_reason": "stop"}]))
+            return
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        # Tokens go out in ~20 ms batches: one sleep per token would measure the event loop, not the app.
+        batch = max(1, round(self.stub["tokens_per_second"] * 0.02))
+        chunk = dict(base, object="chat.completion.chunk")
+        for start in range(0, len(words), batch):
+            text = ("" if start == 0 else " ") + " ".join(words[start:start + batch])
+            delta = {"role": "assistant", "content": text} if start == 0 else {"content": text}
+            self.write(f"data: {json.dumps(dict(chunk, choices=[{'index': 0, 'delta': delta}]))}\n\n")
+            await self.flush()
+            await asyncio.sleep(len(words[start:start + batch]) / self.stub["tokens_per_second"])
+        done = {"index": 0, "delta": {}, "finish_reason": "stop"}
+        self.write(f"data: {json.dumps(dict(chunk, choices=[done]))}\n\n")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.write(f"data: {json.dumps(dict(chunk, choices=[], usage=usage))}\n\n")
+        self.write("data: [DONE]\n\n")
+
+
+class EmbeddingsHandler(StubHandler):
+    async def post(self):
+        body = json.loads(self.request.body)
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # Token-id inputs (OpenAIEmbeddings sends these when tiktoken is available) are hashed as text.
+        texts = [text if isinstance(text, str) else " ".join(map(str, text)) for text in inputs]
+        self.stats["embeddings"] += 1
+        self.stats["embedded_texts"] += len(texts)
+        await asyncio.sleep((self.stub["embedding_ms"] + self.stub["embedding_ms_per_input"] * len(texts)) / 1000)
+        if self.inject_error():
+            return
+        vectors = HashedNgramEmbeddings(size=body.get("dimensions") or self.stub["dimensions"])._matrix(texts)
+        if body.get("encoding_format") == "base64":
+            data = [base64.b64encode(v.astype("<f4").tobytes()).decode() for v in vectors]
+        else:
+            data = vectors.tolist()
+        tokens = sum(count_tokens(text) for text in texts)
+        self.write({
+            "object": "list",
+            "model": body.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(data)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+class StubStatsHandler(tornado.web.RequestHandler):
+    def initialize(self, stats):
+        self.stats = stats
+
+    def get(self):
+        self.write(dict(self.stats))
+
+
+def stub_settings(first_token_ms=400, tokens_per_second=50, completion_tokens=60, embedding_ms=80,
+                  embedding_ms_per_input=1, error_rate=0.0, error_status=500, dimensions=1536):
+    """Simulated API behaviour; the defaults are in the range of gpt-3.5-turbo and ada-002."""
+    return {key: value for key, value in locals().items()}
+
+
+def make_stub_app(settings, stats):
+    handler_args = {"settings": settings, "stats": stats}
+    return tornado.web.Application([
+        (r"/v1/chat/completions", ChatCompletionsHandler, handler_args),
+        (r"/v1/embeddings", EmbeddingsHandler, handler_args),
+        (r"/stub/stats", StubStatsHandler, {"stats": stats}),
+    ])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(settings, port=0, host="127.0.0.1"):
+    """Serve the stub from a daemon thread; returns (base_url, stats Counter)."""
+    port = port or free_port()
+    stats = Counter()
+    ready = threading.Event()
+
+    def run():
+        async def serve():
+            make_stub_app(settings, stats).listen(port, address=host)
+            ready.set()
+            await asyncio.Event().wait()
+
+        asyncio.run(serve())
+
+    threading.Thread(target=run, name="openai-stub", daemon=True).start()
+    ready.wait()
+    return f"http://{host}:{port}/v1", stats
+
+
+# --- Simulated visitors ---
+class LoadStats:
+    """Latencies and outcomes of one ramp level; `kind` is "load" (page load) or "ask"."""
+
+    def __init__(self):
+        self.latencies = {"load": [], "ask": []}
+        self.outcomes = Counter()  # ok / error:<reason>
+        self.routes = Counter()
+
+    def add(self, kind, started, error=None, route=None):
+        if error:
+            self.outcomes[f"error:{error}"] += 1
+            return
+        self.latencies[kind].append(time.perf_counter() - started)
+        self.outcomes[f"{kind}_ok"] += 1
+        if route:
+            self.routes[route] += 1
+
+    def summary(self, seconds):
+        asks = self.latencies["ask"]
+        errors = sum(n for outcome, n in self.outcomes.items() if outcome.startswith("error:"))
+        attempts = self.outcomes["load_ok"] + len(asks) + errors
+        return {
+            "seconds": seconds,
+            "asks": len(asks),
+            "throughput": len(asks) / seconds if seconds else 0.0,
+            "p50": percentile(asks, 50) if asks else None,
+            "p95": percentile(asks, 95) if asks else None,
+            "p99": percentile(asks, 99) if asks else None,
+            "page_load_p50": percentile(self.latencies["load"], 50) if self.latencies["load"] else None,
+            "error_rate": errors / attempts if attempts else 0.0,
+            "outcomes": dict(self.outcomes),
+            "routes": dict(self.routes),
+        }
+
+
+async def _rerun(ws, widgets, timeout):
+    """Send one script rerun and collect new elements until it finishes; returns (status, elements)."""
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    message = BackMsg()
+    message.rerun_script.query_string = ""
+    message.rerun_script.widget_states.widgets.extend(widgets)
+    await ws.write_message(message.SerializeToString(), binary=True)
+    elements = []
+    while True:
+        raw = await asyncio.wait_for(ws.read_message(), timeout)
+        if raw is None:
+            raise ConnectionError("websocket closed")
+        forward = ForwardMsg()
+        forward.ParseFromString(raw)
+        kind = forward.WhichOneof("type")
+        if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+            element = forward.delta.new_element
+            elements.append((element.WhichOneof("type"), element))
+        elif kind == "script_finished":
+            return forward.script_finished, elements
+
+
+async def streamlit_visitor(address, conversation, stats, think, timeout):
+    """One visitor: open the page over Streamlit's websocket, ask the conversation, leave."""
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+    from tornado.websocket import websocket_connect
+
+    finished = ForwardMsg.ScriptFinishedStatus.FINISHED_SUCCESSFULLY
+    started = time.perf_counter()
+    ws = await asyncio.wait_for(websocket_connect(f"ws://{address}/_stcore/stream", max_message_size=1 << 26), timeout)
+    try:
+        status, elements = await _rerun(ws, [], timeout)
+        stats.add("load", started, error=None if status == finished else "script")
+        text_input = next(e.text_input.id for kind, e in elements if kind == "text_input")
+        submit = next(e.button.id for kind, e in elements if kind == "button" and e.button.is_form_submitter)
+        for question in conversation:
+            await asyncio.sleep(think)
+            started = time.perf_counter()
+            status, elements = await _rerun(ws, [
+                WidgetState(id=text_input, string_value=question),
+                WidgetState(id=submit, trigger_value=True),
+            ], timeout)
+            failed = status != finished or any(kind == "exception" for kind, _ in elements)
+            stats.add("ask", started, error="app" if failed else None)
+    finally:
+        ws.close()
+
+
+async def server_visitor(client, base_url, conversation, stats, think, timeout):
+    """One visitor of server.py: the conversation as POST /ask requests carrying their history."""
+    history = []
+    for question in conversation:
+        await asyncio.sleep(think)
+        started = time.perf_counter()
+        response = await client.post(f"{base_url}/ask", json={"question": question, "history": history},
+                                     timeout=timeout)
+        if response.status_code != 200:
+            stats.add("ask", started, error=f"http_{response.status_code}")
+            return
+        body = response.json()
+        stats.add("ask", started, route=body["route"])
+        history.append([question, body["answer"]])
+
+
+async def run_level(visit, conversations, sessions, duration, seed, unique):
+    """Keep `sessions` visitors active for `duration` seconds; each starts a new conversation when done."""
+    stats = LoadStats()
+    deadline = time.perf_counter() + duration
+
+    async def session(number):
+        rng = random.Random(seed * 1000 + number)
+        visits = 0
+        while time.perf_counter() < deadline:
+            conversation = rng.choice(conversations)
+            if unique:
+                # Defeats the answer cache and baked answers, so every question reaches the LLM.
+                conversation = [f"{question} [visitor {number}.{visits}]" for question in conversation]
+            visits += 1
+            try:
+                await visit(conversation, stats)
+            except Exception as exc:
+                stats.add("ask", 0, error=type(exc).__name__)
+                await asyncio.sleep(0.5)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(number) for number in range(sessions)))
+    return stats.summary(time.perf_counter() - started)
+
+
+# --- Serving modes under test ---
+def wait_ready(url, process, name, timeout=300):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with {process.returncode}; see its log")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def start_target(mode, env, work_dir, server_args):
+    """Start the app or server.py against the stub; returns (process, host:port, log path)."""
+    import shlex
+
+    port = free_port()
+    log_path = os.path.join(work_dir, f"{mode}.log")
+    if mode == "streamlit":
+        secrets_path = os.path.join(work_dir, "secrets.toml")
+        with open(secrets_path, "w", encoding="utf-8") as f:
+            f.write('OPENAI_API_KEY = "stub"\n')
+        command = ["-m", "streamlit", "run", "app_faiss.py", "--server.port", str(port), "--server.headless", "true",
+                   "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false",
+                   "--secrets.files", secrets_path]
+        ready_url = f"http://127.0.0.1:{port}/_stcore/health"
+    else:
+        command = ["server.py", "--port", str(port), *shlex.split(server_args)]
+        ready_url = f"http://127.0.0.1:{port}/healthz"
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen([sys.executable, *command], cwd=APP_DIR, env=env, stdout=log,
+                                   stderr=subprocess.STDOUT)
+    try:
+        wait_ready(ready_url, process, mode)
+    except Exception:
+        process.terminate()
+        raise
+    return process, f"127.0.0.1:{port}", log_path
+
+
+async def ramp(mode, address, conversations, args, stub_stats):
+    import httpx
+
+    client = httpx.AsyncClient(limits=httpx.Limits(max_connections=max(args.sessions) * 2))
+
+    async def visit(conversation, stats):
+        if mode == "streamlit":
+            await streamlit_visitor(address, conversation, stats, args.think_time, args.timeout)
+        else:
+            await server_visitor(client, f"http://{address}", conversation, stats, args.think_time, args.timeout)
+
+    # Warm-up: the first requests build the index and clients; not part of any level.
+    await visit(conversations[0], LoadStats())
+    levels = []
+    try:
+        for sessions in args.sessions:
+            before = Counter(stub_stats)
+            result = await run_level(visit, conversations, sessions, args.duration, args.seed, args.unique)
+            result["sessions"] = sessions
+            result["stub"] = {key: stub_stats[key] - before[key]
+                              for key in ("chat", "embeddings", "errors_injected", "completion_tokens")}
+            result["stub"]["max_inflight"] = stub_stats["max_inflight"]
+            levels.append(result)
+            print_level(mode, result)
+    finally:
+        await client.aclose()
+    return levels
+
+
+def saturation(levels):
+    """The level after which adding sessions stops adding SATURATION_GAIN throughput, or None."""
+    for level, following in zip(levels, levels[1:]):
+        if following["throughput"] < level["throughput"] * (1 + SATURATION_GAIN):
+            return level
+    return None
+
+
+def _seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def print_level(mode, level):
+    print(f"{mode:>9} {level['sessions']:>8} {level['asks']:>5} {level['throughput']:>6.2f} "
+          f"{_seconds(level['p50']):>6} {_seconds(level['p95']):>6} {_seconds(level['p99']):>6} "
+          f"{level['error_rate']:>6.1%} {_seconds(level['page_load_p50']):>6} {level['stub']['chat']:>6}",
+          flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ramp concurrent simulated visitors against a stub OpenAI API.")
+    parser.add_argument("--mode", nargs="+", choices=["streamlit", "server"], default=["streamlit", "server"])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="ramp levels")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per level")
+    parser.add_argument("--think-time", type=float, default=1.0, help="seconds between a visitor's questions")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds before a request counts as failed")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="JSON list of conversations")
+    parser.add_argument("--unique", action="store_true", help="make every question unique to bypass caches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server-args", default="", help="extra server.py arguments, e.g. \"--max-llm-calls 16\"")
+    parser.add_argument("--work-dir", default=LOADTEST_CACHE_DIR, help="index cache, logs and secrets for the runs")
+    parser.add_argument("--output", help="write the full report as JSON")
+    parser.add_argument("--stub-only", action="store_true", help="only serve the stub until interrupted")
+    parser.add_argument("--stub-port", type=int, default=0)
+    stub = parser.add_argument_group("stub API behaviour")
+    defaults = stub_settings()
+    for name, value in defaults.items():
+        stub.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("tornado.access").setLevel(logging.CRITICAL)  # injected 5xx are counted, not logged
+    settings = {name: getattr(args, name) for name in defaults}
+    base_url, stub_stats = start_stub(settings, args.stub_port)
+    if args.stub_only:
+        print(f"stub OpenAI API at {base_url}; set OPENAI_BASE_URL={base_url}")
+        threading.Event().wait()
+
+    with open(args.questions, encoding="utf-8") as f:
+        conversations = json.load(f)
+    os.makedirs(args.work_dir, exist_ok=True)
+    # Own index cache: the stub's vectors must never end up in the real one.
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY="stub",
+               INDEX_CACHE_DIR=os.path.abspath(args.work_dir))
+    env.pop("FAKE_LLM", None)
+    env.setdefault("BUNDLE_AUTO_BAKE", "0")  # baking at startup would add LLM traffic to the first levels
+    report = {"stub": settings, "args": {k: v for k, v in vars(args).items() if k not in defaults}, "modes": {}}
+    print(f"{'mode':>9} {'sessions':>8} {'asks':>5} {'req/s':>6} {'p50':>6} {'p95':>6} {'p99':>6} "
+          f"{'errors':>6} {'load':>6} {'llm':>6}")
+    for mode in args.mode:
+        process, address, log_path = start_target(mode, env, args.work_dir, args.server_args)
+        try:
+            report["modes"][mode] = asyncio.run(ramp(mode, address, conversations, args, stub_stats))
+        finally:
+            process.terminate()
+            process.wait()
+        logger.info("%s log: %s", mode, log_path)
+    for mode, levels in report["modes"].items():
+        knee = saturation(levels)
+        if knee is None:
+            print(f"{mode}: still scaling at {levels[-1]['sessions']} sessions "
+                  f"({levels[-1]['throughput']:.2f} req/s); extend --sessions")
+        else:
+            print(f"{mode}: saturates at about {knee['sessions']} sessions "
+                  f"({knee['throughput']:.2f} req/s, p95 {_seconds(knee['p95'])}s)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from index_cache import CACHE_DIR, index_dir
+from qa import percentile
+
+# --- Local CPU embedding backends ---
+# Drop-in alternatives to OpenAIEmbeddings for deployments that opt in with
+# EMBEDDING_BACKEND (see resources.get_embedding_backend). Both embed a whole
+# batch with a handful of NumPy operations, so a query takes well under a
+# millisecond and needs no network. Each exposes `model`, which the index manifest records, so
+# an index is only ever queried with the backend that built it.
+HASHING_SIZE = 768
+HASHING_NGRAMS = (3, 4, 5)
+WORD_PATTERN = re.compile(r"\w+")
+_PRIME = np.uint64(1099511628211)  # FNV-1a 64-bit prime, used as the rolling-hash base
+_MIX = np.uint64(0xBF58476D1CE4E5B9)  # splitmix64 multiplier
+
+
+def unit_rows(vectors):
+    """Rows of `vectors` scaled to unit length (zero rows stay zero), as float32."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class HashedNgramEmbeddings(Embeddings):
+    """Signed feature hashing of character n-grams with sublinear term frequency.
+
+    The zero-dependency baseline: no model file and no training. Texts are
+    lower-cased, padded with spaces so n-grams mark word boundaries, and every
+    n-gram is hashed into one of `size` signed buckets with a vectorized
+    rolling hash over the UTF-8 bytes of the whole batch.
+    """
+
+    def __init__(self, size=HASHING_SIZE, ngrams=HASHING_NGRAMS):
+        self.size = size
+        self.ngrams = tuple(ngrams)
+        self.model = f"hashed-ngram-{'-'.join(map(str, self.ngrams))}-{size}"
+
+    def _matrix(self, texts):
+        # One byte array for the batch; NUL separates texts so no n-gram spans two of them.
+        encoded = [f" {' '.join(WORD_PATTERN.findall(text.lower()))} ".encode() for text in texts]
+        codes = np.frombuffer(b"\0".join(encoded), dtype=np.uint8).astype(np.uint64)
+        rows = np.repeat(np.arange(len(texts)), [len(e) + 1 for e in encoded])[:len(codes)]
+        separators = np.concatenate([[0], np.cumsum(codes == 0)])
+        counts = np.zeros(len(texts) * self.size, dtype=np.float32)
+        for n in self.ngrams:
+            grams = len(codes) - n + 1
+            if grams <= 0:
+                continue
+            hashes = np.zeros(grams, dtype=np.uint64)
+            for offset in range(n):
+                hashes = hashes * _PRIME + codes[offset:offset + grams]
+            hashes ^= hashes >> np.uint64(31)
+            hashes *= _MIX
+            hashes ^= hashes >> np.uint64(29)
+            valid = separators[n:n + grams] == separators[:grams]
+            signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)[valid]
+            buckets = (hashes % np.uint64(self.size)).astype(np.int64)[valid]
+            counts += np.bincount(rows[:grams][valid] * self.size + buckets, weights=signs,
+                                  minlength=len(counts)).astype(np.float32)
+        matrix = counts.reshape(len(texts), self.size)
+        return unit_rows(np.sign(matrix) * np.log1p(np.abs(matrix)))
+
+    def embed_documents(self, texts):
+        return self._matrix(list(texts)).tolist() if texts else []
+
+    def embed_query(self, text):
+        return self._matrix([text])[0].tolist()
+
+    async def aembed_query(self, text):
+        # Microseconds of NumPy; cheaper inline than a hop to the default executor.
+        return self.embed_query(text)
+
+
+class StaticVectorEmbeddings(Embeddings):
+    """Mean of pre-trained word vectors loaded from an .npz model file on disk.
+
+    The file holds `words` (N strings) and `vectors` (N x d float32), e.g. a
+    GloVe, fastText or distilled static model exported with numpy.savez.
+    Unknown words are skipped; a text with none known embeds to zeros.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.vectors = np.asarray(data["vectors"], dtype=np.float32)
+            self.vocabulary = {str(word): i for i, word in enumerate(data["words"])}
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.model = f"static-{os.path.splitext(os.path.basename(path))[0]}-{digest.hexdigest()[:12]}"
+
+    def _matrix(self, texts):
+        rows, words = [], []
+        for row, text in enumerate(texts):
+            for word in WORD_PATTERN.findall(text.lower()):
+                index = self.vocabulary.get(word)
+                if index is not None:
+                    rows.append(row)
+                    words.append(index)
+        matrix = np.zeros((len(texts), self.vectors.shape[1]), dtype=np.float32)
+        np.add.at(matrix, np.asarray(rows, dtype=np.int64), self.vectors[np.asarray(words, dtype=np.int64)])
+        return unit_rows(matrix)
+
+    def embed_documents(self, texts):
+        return self._matrix(list(texts)).tolist() if texts else []
+
+    def embed_query(self, text):
+        return self._matrix([text])[0].tolist()
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+# --- Benchmark: latency and retrieval quality of a local backend ---
+def main():
+    # ingest imports resources, which imports this module, so import it lazily here.
+    from ingest import DOCUMENT_PATHS, load_or_build_index
+    from resources import get_embedding_backend
+    from retrieval import EVAL_PATH, HybridRetriever, benchmark, load_bm25
+
+    parser = argparse.ArgumentParser(description="Benchmark a local embedding backend.")
+    parser.add_argument("--backend", default="hashing", help="hashing or static:<path.npz>")
+    parser.add_argument("--examples", default=EVAL_PATH)
+    parser.add_argument("--cache-dir", default=os.path.join(CACHE_DIR, "local-bench"))
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    embedding = get_embedding_backend(None, args.backend)
+    with open(args.examples, encoding="utf-8") as f:
+        examples = json.load(f)
+    questions = [example["question"] for example in examples]
+    timings = []
+    for _ in range(args.repeat):
+        for question in questions:
+            started = time.perf_counter()
+            embedding.embed_query(question)
+            timings.append((time.perf_counter() - started) * 1e6)
+    print(f"{embedding.model}: query embedding p50 {percentile(timings, 50):.0f} us, "
+          f"p99 {percentile(timings, 99):.0f} us")
+
+    vectorstore, _ = load_or_build_index(embedding, DOCUMENT_PATHS, cache_dir=args.cache_dir)
+    texts = [vectorstore.docstore.search(i).page_content for i in vectorstore.index_to_docstore_id.values()]
+    started = time.perf_counter()
+    embedding.embed_documents(texts * 10)
+    print(f"batch embedding: {len(texts) * 10 / (time.perf_counter() - started):.0f} chunks/sec")
+    report = benchmark({
+        "faiss": vectorstore.as_retriever(search_kwargs={"k": 6}),
+        "hybrid": HybridRetriever(vectorstore=vectorstore, bm25=load_bm25(index_dir(args.cache_dir), vectorstore)),
+    }, examples)
+    for name, scores in report.items():
+        print(f"{name:>7}: hit rate {scores['hit_rate']:.2f}  mean {scores['mean_ms']:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
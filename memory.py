@@ -0,0 +1,160 @@
+import argparse
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.chains import LLMChain
+
+from fakes import FakeStreamingChatModel
+from prompts import condense_prompt, custom_prompt, summary_prompt
+from qa import format_chat_history
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Bounded conversation memory ---
+# Each session keeps its last turns verbatim within a token budget. Older turns
+# are folded into a rolling summary by a background thread, so the history part
+# of the condense and answer prompts stays about the same size however long the
+# conversation runs.
+HISTORY_MAX_TURNS = 6
+HISTORY_TOKEN_BUDGET = 800  # tokens of verbatim turns
+SUMMARY_WORKERS = 2  # summary refreshes running at once, across all sessions
+
+memory_stats = Counter()  # turns_folded, summaries, summary_errors, summary_seconds
+_summary_pool = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+
+
+class ChatHistory(list):
+    """The (question, answer) turns to show the LLM, plus a summary of older ones."""
+
+    def __init__(self, turns=(), summary=""):
+        super().__init__(turns)
+        self.summary = summary
+
+
+def turn_tokens(turn):
+    return count_tokens(format_chat_history([turn]))
+
+
+def bound_turns(turns, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+    """Split turns into (older, recent) where recent is the longest suffix within both limits.
+
+    The latest turn is always kept, even when it alone exceeds the budget.
+    """
+    recent, used = [], 0
+    for turn in reversed(turns):
+        tokens = turn_tokens(turn)
+        if recent and (len(recent) >= max_turns or used + tokens > budget):
+            break
+        recent.append(turn)
+        used += tokens
+    recent.reverse()
+    return list(turns[:len(turns) - len(recent)]), recent
+
+
+class ConversationMemory:
+    """Per-session memory: recent turns verbatim, older turns as a rolling summary.
+
+    Keep one in st.session_state. `add` never waits for the LLM: folded turns
+    queue up and a background refresh merges them into the summary; until it
+    finishes they are simply left out of the prompt.
+    """
+
+    def __init__(self, summarizer=None, max_turns=HISTORY_MAX_TURNS, budget=HISTORY_TOKEN_BUDGET):
+        self.summarizer = summarizer
+        self.max_turns = max_turns
+        self.budget = budget
+        self.summary = ""
+        self._turns = []
+        self._pending = []  # folded turns not yet in the summary
+        self._refreshing = False
+        self._generation = 0  # bumped by clear() so a running refresh cannot restore the old summary
+        self._lock = threading.Lock()
+
+    def history(self):
+        """ChatHistory to pass to ConversationalQA in place of the raw turn list."""
+        with self._lock:
+            return ChatHistory(self._turns, self.summary)
+
+    def add(self, question, answer):
+        with self._lock:
+            older, self._turns = bound_turns(self._turns + [(question, answer)], self.max_turns, self.budget)
+            if not older:
+                return
+            memory_stats["turns_folded"] += len(older)
+            if self.summarizer is None:
+                return
+            self._pending.extend(older)
+            if self._refreshing:
+                return
+            self._refreshing = True
+        _summary_pool.submit(self._refresh)
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self._turns = []
+            self._pending = []
+            self._generation += 1
+
+    def wait(self, timeout=10.0):
+        """Block until no refresh is running (for scripts and tests; the app never waits)."""
+        deadline = time.monotonic() + timeout
+        while self._refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _refresh(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                summary, generation = self.summary, self._generation
+                if not pending:
+                    self._refreshing = False
+                    return
+            started = time.perf_counter()
+            try:
+                result = self.summarizer.invoke({"summary": summary, "new_lines": format_chat_history(pending)})
+                summary = result[self.summarizer.output_key].strip()
+                memory_stats["summaries"] += 1
+            except Exception:
+                # Keep the old summary; those turns are lost rather than retried forever.
+                logger.exception("conversation summary refresh failed")
+                memory_stats["summary_errors"] += 1
+            memory_stats["summary_seconds"] += time.perf_counter() - started
+            with self._lock:
+                if generation == self._generation:
+                    self.summary = summary
+
+
+# --- Measurement: history tokens per turn, unbounded vs bounded ---
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt history size per turn with and without bounded memory.")
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--max-turns", type=int, default=HISTORY_MAX_TURNS)
+    parser.add_argument("--budget", type=int, default=HISTORY_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    llm = FakeStreamingChatModel(first_token_latency=0.0, token_latency=0.0)
+    memory = ConversationMemory(LLMChain(llm=llm, prompt=summary_prompt), args.max_turns, args.budget)
+    prompt_overhead = count_tokens(custom_prompt.format(context="", question="", chat_history=""))
+    turns = []
+    print(f"{'turn':>5} {'unbounded':>10} {'bounded':>8}  (history tokens in the answer prompt)")
+    for i in range(1, args.turns + 1):
+        turn = (f"Question {i}: what else has Mahitha worked on in project number {i}?", llm.response)
+        turns.append(turn)
+        memory.add(*turn)
+        memory.wait()
+        unbounded = count_tokens(format_chat_history(turns))
+        bounded = count_tokens(format_chat_history(memory.history()))
+        if i == 1 or i % 5 == 0:
+            print(f"{i:>5} {unbounded:>10} {bounded:>8}")
+    print(f"prompt template overhead: {prompt_overhead} tokens; condense template: "
+          f"{count_tokens(condense_prompt.format(chat_history='', question=''))} tokens")
+    print(f"memory stats: {dict(memory_stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# --- Per-request tracing ---
+# A Trace is bound to the current context while a question is answered; code
+# anywhere in the pipeline adds spans and token counts through the module-level
+# helpers below, which do nothing when no trace is active.
+PROMPT_COST_PER_1K = 0.0005  # USD, gpt-3.5-turbo input
+COMPLETION_COST_PER_1K = 0.0015  # USD, gpt-3.5-turbo output
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    def __init__(self, query=""):
+        self.id = uuid.uuid4().hex[:12]
+        self.query = query
+        self.started_at = time.time()
+        self.route = None
+        self.spans = []
+        self.tokens = Counter()  # prompt / completion
+        self.llm_calls = 0
+        self.cache = {}  # cache name -> "hit" / "miss"
+        self.attributes = {}
+        self.duration = None
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append({
+                "name": name,
+                "start_ms": (started - self._started) * 1000,
+                "duration_ms": (time.perf_counter() - started) * 1000,
+            })
+
+    @property
+    def cost(self):
+        return (self.tokens["prompt"] * PROMPT_COST_PER_1K
+                + self.tokens["completion"] * COMPLETION_COST_PER_1K) / 1000
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "time": self.started_at,
+            "query": self.query,
+            "route": self.route,
+            "duration_ms": None if self.duration is None else self.duration * 1000,
+            "spans": self.spans,
+            "tokens": dict(self.tokens),
+            "llm_calls": self.llm_calls,
+            "cost_usd": self.cost,
+            "cache": self.cache,
+            "attributes": self.attributes,
+        }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+
+def record_llm_call(prompt_tokens, completion_tokens):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.llm_calls += 1
+        trace.tokens["prompt"] += prompt_tokens
+        trace.tokens["completion"] += completion_tokens
+
+
+def record_cache(name, hit):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.cache[name] = "hit" if hit else "miss"
+
+
+def set_route(route):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.route = route
+
+
+def annotate(key, value):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+@contextmanager
+def start_trace(query, registry=None):
+    """Bind a new Trace for the duration of one request and record it on exit."""
+    trace = Trace(query)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+        if registry is not None:
+            registry.record(trace)
+
+
+# --- Process-wide metrics ---
+class MetricsRegistry:
+    """Aggregates finished traces; exports Prometheus text and an optional JSONL log."""
+
+    def __init__(self, log_path=None, keep_recent=50):
+        self.log_path = log_path
+        self.requests = Counter()  # route -> count
+        self.stage_seconds = Counter()  # span name -> total seconds
+        self.stage_count = Counter()  # span name -> count
+        self.tokens = Counter()
+        self.cache = Counter()  # (cache, hit/miss) -> count
+        self.cost = 0.0
+        self.latency_buckets = Counter()
+        self.latency_sum = 0.0
+        self.recent = deque(maxlen=keep_recent)
+        self.collectors = []  # callables returning extra Prometheus text, e.g. ProfileRegistry.prometheus_text
+        self._lock = threading.Lock()
+
+    def record(self, trace):
+        data = trace.to_dict()
+        with self._lock:
+            self.requests[trace.route or "unknown"] += 1
+            for item in trace.spans:
+                self.stage_seconds[item["name"]] += item["duration_ms"] / 1000
+                self.stage_count[item["name"]] += 1
+            self.tokens.update(trace.tokens)
+            self.tokens["llm_calls"] += trace.llm_calls
+            for name, outcome in trace.cache.items():
+                self.cache[(name, outcome)] += 1
+            self.cost += trace.cost
+            self.latency_sum += trace.duration
+            for bound in LATENCY_BUCKETS:
+                if trace.duration <= bound:
+                    self.latency_buckets[bound] += 1
+            self.recent.append(data)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(data) + "\n")
+
+    def prometheus_text(self):
+        with self._lock:
+            total = sum(self.requests.values())
+            lines = ["# TYPE portfolio_requests_total counter"]
+            lines += [f'portfolio_requests_total{{route="{r}"}} {n}' for r, n in sorted(self.requests.items())]
+            lines.append("# TYPE portfolio_request_seconds histogram")
+            for bound in LATENCY_BUCKETS:
+                lines.append(f'portfolio_request_seconds_bucket{{le="{bound}"}} {self.latency_buckets[bound]}')
+            lines.append(f'portfolio_request_seconds_bucket{{le="+Inf"}} {total}')
+            lines.append(f"portfolio_request_seconds_sum {self.latency_sum:.6f}")
+            lines.append(f"portfolio_request_seconds_count {total}")
+            lines.append("# TYPE portfolio_stage_seconds summary")
+            for name in sorted(self.stage_count):
+                lines.append(f'portfolio_stage_seconds_sum{{stage="{name}"}} {self.stage_seconds[name]:.6f}')
+                lines.append(f'portfolio_stage_seconds_count{{stage="{name}"}} {self.stage_count[name]}')
+            lines.append("# TYPE portfolio_tokens_total counter")
+            lines += [f'portfolio_tokens_total{{kind="{k}"}} {n}' for k, n in sorted(self.tokens.items())]
+            lines.append("# TYPE portfolio_cache_requests_total counter")
+            lines += [
+                f'portfolio_cache_requests_total{{cache="{name}",result="{outcome}"}} {n}'
+                for (name, outcome), n in sorted(self.cache.items())
+            ]
+            lines.append("# TYPE portfolio_cost_usd_total counter")
+            lines.append(f"portfolio_cost_usd_total {self.cost:.6f}")
+        return "\n".join(lines) + "\n" + "".join(collect() for collect in self.collectors)
+
+
+def start_metrics_server(registry, port, host="127.0.0.1"):
+    """Serve registry.prometheus_text() at http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("metrics at http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,149 @@
+import argparse
+import json
+import logging
+import threading
+
+from langchain_core.documents import Document
+
+from index_cache import CACHE_DIR, index_dir
+from ingest import load_or_build_index
+from resources import get_embedding_backend
+from retrieval import EVAL_PATH, HybridRetriever, covers_expected, load_bm25, tokenize
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+_stats_lock = threading.Lock()
+
+# --- Context assembly between retrieval and the stuff prompt ---
+CONTEXT_TOKEN_BUDGET = 900  # tokens of retrieved context per prompt
+MMR_LAMBDA = 0.7  # 1.0 = rank order only, 0.0 = diversity only
+DUPLICATE_SIMILARITY = 0.8  # token Jaccard above which a chunk counts as a near-duplicate
+
+
+def merge_overlapping(documents):
+    """Merge chunks from the same source whose character ranges overlap or touch.
+
+    Keeps retrieval order: a merged chunk takes the position of its best-ranked part.
+    """
+    by_source = {}
+    for rank, document in enumerate(documents):
+        if "offset" not in document.metadata:
+            by_source.setdefault(("", rank), []).append((rank, document))
+            continue
+        by_source.setdefault(document.metadata.get("source", ""), []).append((rank, document))
+
+    merged = []
+    for parts in by_source.values():
+        parts.sort(key=lambda part: part[1].metadata.get("offset", 0))
+        best_rank, current = parts[0]
+        for rank, document in parts[1:]:
+            end = current.metadata["offset"] + len(current.page_content)
+            start = document.metadata["offset"]
+            if start > end:
+                merged.append((best_rank, current))
+                best_rank, current = rank, document
+                continue
+            tail = document.page_content[end - start:]
+            current = Document(page_content=current.page_content + tail, metadata=dict(
+                current.metadata,
+                page_end=max(current.metadata.get("page_end") or 0, document.metadata.get("page_end") or 0),
+            ))
+            best_rank = min(best_rank, rank)
+        merged.append((best_rank, current))
+    return [document for _, document in sorted(merged, key=lambda item: item[0])]
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def mmr_order(documents, lambda_mult=MMR_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+    """Reorder by maximal marginal relevance on token sets, dropping near-duplicates.
+
+    Relevance is the retrieval rank, so this needs no extra embedding calls.
+    """
+    terms = [set(tokenize(d.page_content)) for d in documents]
+    relevance = [1.0 - rank / len(documents) for rank in range(len(documents))]
+    remaining = list(range(len(documents)))
+    selected = []
+    while remaining:
+        best, best_score = None, None
+        for i in list(remaining):
+            redundancy = max((_jaccard(terms[i], terms[j]) for j in selected), default=0.0)
+            if redundancy >= duplicate_similarity:
+                remaining.remove(i)
+                continue
+            score = lambda_mult * relevance[i] - (1 - lambda_mult) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score = i, score
+        if best is None:
+            break
+        selected.append(best)
+        remaining.remove(best)
+    return [documents[i] for i in selected]
+
+
+def pack(documents, budget=CONTEXT_TOKEN_BUDGET):
+    """Take documents in order while they fit the token budget; skip ones that do not."""
+    packed, used = [], 0
+    for document in documents:
+        tokens = count_tokens(document.page_content)
+        if used + tokens > budget:
+            continue
+        packed.append(document)
+        used += tokens
+    return packed, used
+
+
+class ContextAssembler:
+    """Merge overlapping chunks, diversify with MMR and pack to a token budget."""
+
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, lambda_mult=MMR_LAMBDA,
+                 duplicate_similarity=DUPLICATE_SIMILARITY, stats=None):
+        self.budget = budget
+        self.lambda_mult = lambda_mult
+        self.duplicate_similarity = duplicate_similarity
+        self.stats = {"requests": 0, "tokens_in": 0, "tokens_out": 0} if stats is None else stats
+
+    def assemble(self, documents):
+        """Return (packed documents, report) where report has tokens before/after and saved."""
+        tokens_in = sum(count_tokens(d.page_content) for d in documents)
+        ordered = mmr_order(merge_overlapping(documents), self.lambda_mult, self.duplicate_similarity)
+        packed, tokens_out = pack(ordered, self.budget)
+        with _stats_lock:
+            self.stats["requests"] += 1
+            self.stats["tokens_in"] += tokens_in
+            self.stats["tokens_out"] += tokens_out
+        report = {"tokens_in": tokens_in, "tokens_out": tokens_out, "tokens_saved": tokens_in - tokens_out}
+        logger.info("context tokens %(tokens_in)d -> %(tokens_out)d (saved %(tokens_saved)d)", report)
+        return packed, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure context packing on the retrieval question set.")
+    parser.add_argument("--examples", default=EVAL_PATH)
+    parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--k", type=int, default=6, help="chunks retrieved before packing")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    embedding = get_embedding_backend()
+    vectorstore, _ = load_or_build_index(embedding, cache_dir=args.cache_dir)
+    retriever = HybridRetriever(vectorstore=vectorstore, bm25=load_bm25(index_dir(args.cache_dir), vectorstore), k=args.k)
+    assembler = ContextAssembler(budget=args.budget)
+    with open(args.examples, encoding="utf-8") as f:
+        examples = json.load(f)
+    hits_before = hits_after = 0
+    for example in examples:
+        documents = retriever.invoke(example["question"])
+        packed, _ = assembler.assemble(documents)
+        hits_before += covers_expected(documents, example["expect"])
+        hits_after += covers_expected(packed, example["expect"])
+    stats = assembler.stats
+    print(f"context tokens/request: {stats['tokens_in'] / len(examples):.0f} -> "
+          f"{stats['tokens_out'] / len(examples):.0f}")
+    print(f"hit rate: {hits_before / len(examples):.2f} -> {hits_after / len(examples):.2f}")
+
+
+if __name__ == "__main__":
+    main()
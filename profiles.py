@@ -0,0 +1,311 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+from langchain.chains import LLMChain
+from langchain_core.prompts import PromptTemplate
+
+from compact_index import memory_mb
+from engine import QAEngine
+from fakes import FakeStreamingChatModel
+from index_cache import CACHE_DIR, INDEX_FORMAT, index_dir
+from ingest import corpus_fingerprint
+from metrics import MetricsRegistry
+from prompts import condense_prompt, custom_prompt
+from qa import FALLBACK_TEMPLATE
+from resources import build_stuff_chain, get_embedding_backend
+
+logger = logging.getLogger(__name__)
+
+# --- Portfolio profiles ---
+# One deployment serves many people. Each profile is profiles/<id>.json naming
+# its documents, intents, hot questions, intro HTML and optionally its own
+# prompt; relative paths are resolved against the profile file, except
+# documents, which are relative to the profile's corpus "root" (default: the
+# profile's folder). Chunk sources are recorded relative to that root, so
+# `ingest.py --profile <id>` and the app build identical indexes. The app picks
+# one with ?profile=<id>, the HTTP API with a "profile" field.
+#
+# .index_cache/                      the default profile (same layout as before)
+# .index_cache/profiles/<id>/        every other profile's index, embeddings and bundle
+#
+# Engines are built on a profile's first request and kept in an LRU bounded by
+# an estimate of their resident index size, so hundreds of profiles can share
+# one process while only the recently used ones are in memory.
+PROFILES_DIR = os.environ.get("PROFILES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+DEFAULT_PROFILE = os.environ.get("DEFAULT_PROFILE", "mahitha")
+PROFILE_CACHE_MB = float(os.environ.get("PROFILE_CACHE_MB", 512))  # estimated resident index size across profiles
+MAX_LOADED_PROFILES = int(os.environ.get("MAX_LOADED_PROFILES", 64))
+PROFILE_ID = re.compile(r"[a-z0-9][a-z0-9_-]{0,63}")  # also keeps ids from escaping PROFILES_DIR
+
+
+def read_profile(profile_id, profiles_dir=PROFILES_DIR):
+    """Load and resolve profiles/<id>.json; raises KeyError for unknown or malformed ids."""
+    if not isinstance(profile_id, str) or not PROFILE_ID.fullmatch(profile_id):
+        raise KeyError(profile_id)
+    path = os.path.join(profiles_dir, f"{profile_id}.json")
+    if not os.path.exists(path):
+        raise KeyError(profile_id)
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+    folder = os.path.dirname(os.path.abspath(path))
+
+    def resolve(value):
+        return os.path.normpath(os.path.join(folder, value)) if value else None
+
+    profile["id"] = profile_id
+    profile["path"] = path
+    profile["root"] = resolve(profile.get("root", "."))
+    profile["documents"] = [os.path.normpath(os.path.join(profile["root"], p)) for p in profile["documents"]]
+    for key in ("intents", "hot_questions", "intro", "prompt"):
+        profile[key] = resolve(profile.get(key))
+    profile.setdefault("title", f"Ask {profile['name']} (Portfolio QA)")
+    return profile
+
+
+def profile_ids(profiles_dir=PROFILES_DIR):
+    if not os.path.isdir(profiles_dir):
+        return []
+    names = (os.path.splitext(n) for n in os.listdir(profiles_dir))
+    return sorted(stem for stem, ext in names if ext == ".json" and PROFILE_ID.fullmatch(stem))
+
+
+def profile_cache_dir(profile_id, cache_dir=CACHE_DIR):
+    # The default profile keeps the original location so existing caches stay valid.
+    return cache_dir if profile_id == DEFAULT_PROFILE else os.path.join(cache_dir, "profiles", profile_id)
+
+
+def profile_fingerprint(profile):
+    """Changes when the profile file or any of its documents changes on disk; None once it is gone."""
+    try:
+        return os.stat(profile["path"]).st_mtime_ns, corpus_fingerprint(profile["documents"])
+    except FileNotFoundError:
+        return None
+
+
+def profile_prompt(profile):
+    """The answer prompt: the profile's own template if it has one, else the shared one with its name."""
+    if profile["prompt"]:
+        with open(profile["prompt"], encoding="utf-8") as f:
+            prompt = PromptTemplate.from_template(f.read())
+    else:
+        prompt = custom_prompt
+    return prompt.partial(name=profile["name"]) if "name" in prompt.input_variables else prompt
+
+
+def profile_intro(profile):
+    if not profile["intro"]:
+        return f"<div class=\"main-intro-container\"><h3>👋 Ask me about {profile['name']}!</h3></div>"
+    with open(profile["intro"], encoding="utf-8") as f:
+        return f.read()
+
+
+def index_footprint(cache_dir, index_format=INDEX_FORMAT):
+    """Estimated resident bytes of a loaded index: the files read into memory.
+
+    The compact index's vectors and docstore are mmapped and reclaimable page
+    cache, so with INDEX_FORMAT=mmap only the BM25 postings count.
+    """
+    folder = index_dir(cache_dir)
+    names = ["bm25.json"] if index_format == "mmap" else ["bm25.json", "index.faiss", "index.pkl"]
+    paths = [os.path.join(folder, name) for name in names]
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def engine_factory(embedding, question_generator, llm, registry, cache_dir=CACHE_DIR, **options):
+    """Return build_engine(profile) for ProfileRegistry; extra options go to QAEngine."""
+
+    def build_engine(profile):
+        return QAEngine(
+            embedding, question_generator, build_stuff_chain(llm, profile_prompt(profile)),
+            paths=profile["documents"],
+            root=profile["root"],
+            cache_dir=profile_cache_dir(profile["id"], cache_dir),
+            registry=registry,
+            intents_path=profile["intents"],
+            questions_path=profile["hot_questions"],
+            fallback_answer=FALLBACK_TEMPLATE.format(name=profile["name"]),
+            **options,
+        )
+
+    return build_engine
+
+
+class ProfileRegistry:
+    """Process-wide LRU of per-profile engines, loaded lazily and evicted by estimated size.
+
+    `get` builds a profile's engine on first use (one load per profile at a
+    time; other profiles are served meanwhile) and rebuilds it when the profile
+    or its documents change. After each load the least recently used engines
+    are dropped until the estimated total fits `budget_mb` and at most
+    `max_loaded` remain; the engine just loaded is always kept. Requests
+    already holding an evicted engine finish with it.
+    """
+
+    def __init__(self, build_engine, profiles_dir=PROFILES_DIR, budget_mb=PROFILE_CACHE_MB,
+                 max_loaded=MAX_LOADED_PROFILES, keep_events=100):
+        self.build_engine = build_engine
+        self.profiles_dir = profiles_dir
+        self.budget_bytes = budget_mb * 1e6
+        self.max_loaded = max_loaded
+        self.stats = Counter()  # hits, loads, reloads, evictions, load_errors, load_seconds
+        self.events = deque(maxlen=keep_events)  # recent load / reload / evict events
+        self._entries = OrderedDict()  # id -> {"profile", "engine", "fingerprint", "bytes", "last_used"}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, profile_id=DEFAULT_PROFILE):
+        """Return (profile, engine); raises KeyError for unknown profiles."""
+        with self._lock:
+            entry = self._entries.get(profile_id)
+        if entry is not None and entry["fingerprint"] == profile_fingerprint(entry["profile"]):
+            return self._hit(profile_id, entry)
+        profile = read_profile(profile_id, self.profiles_dir)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(profile_id, threading.Lock())
+        with load_lock:
+            fingerprint = profile_fingerprint(profile)
+            with self._lock:
+                entry = self._entries.get(profile_id)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                return self._hit(profile_id, entry)  # loaded by another request while this one waited
+            entry = self._load(profile, fingerprint, "reload" if entry is not None else "load")
+            with self._lock:
+                self._entries[profile_id] = entry
+                self._entries.move_to_end(profile_id)
+                evicted = self._evict()
+            for evicted_id, evicted_entry in evicted:
+                self._record("evict", evicted_id, mb=evicted_entry["bytes"] / 1e6,
+                             idle_seconds=time.time() - evicted_entry["last_used"])
+        return profile, entry["engine"]
+
+    def loaded(self, profile_id):
+        with self._lock:
+            return profile_id in self._entries
+
+    def peek(self, profile_id):
+        """The loaded engine or None, without loading it or counting a use (for stats pages)."""
+        with self._lock:
+            entry = self._entries.get(profile_id)
+        return entry["engine"] if entry else None
+
+    def _hit(self, profile_id, entry):
+        with self._lock:
+            if profile_id in self._entries:
+                self._entries.move_to_end(profile_id)
+            entry["last_used"] = time.time()
+            self.stats["hits"] += 1
+        return entry["profile"], entry["engine"]
+
+    def _load(self, profile, fingerprint, event):
+        started = time.perf_counter()
+        rss_before, _ = memory_mb()
+        try:
+            engine = self.build_engine(profile)
+        except Exception:
+            self.stats["load_errors"] += 1
+            raise
+        seconds = time.perf_counter() - started
+        size = index_footprint(engine.cache_dir)
+        self.stats[event + "s"] += 1
+        self.stats["load_seconds"] += seconds
+        # The RSS delta is only indicative: concurrent loads and requests move it too.
+        self._record(event, profile["id"], seconds=seconds, mb=size / 1e6, rss_delta_mb=memory_mb()[0] - rss_before)
+        return {"profile": profile, "engine": engine, "fingerprint": fingerprint, "bytes": size,
+                "last_used": time.time()}
+
+    def _evict(self):
+        """Drop LRU entries over the limits (caller holds the lock); returns [(id, entry)]."""
+        evicted = []
+        total = sum(entry["bytes"] for entry in self._entries.values())
+        while len(self._entries) > 1 and (len(self._entries) > self.max_loaded or total > self.budget_bytes):
+            profile_id, entry = self._entries.popitem(last=False)
+            total -= entry["bytes"]
+            evicted.append((profile_id, entry))
+            self.stats["evictions"] += 1
+        return evicted
+
+    def _record(self, event, profile_id, **fields):
+        fields = {key: round(value, 3) for key, value in fields.items()}
+        self.events.append(dict(event=event, profile=profile_id, at=time.time(), **fields))
+        logger.info("profile %s %s %s", event, profile_id, " ".join(f"{k}={v}" for k, v in fields.items()))
+
+    def snapshot(self):
+        with self._lock:
+            loaded = {
+                profile_id: {"mb": round(entry["bytes"] / 1e6, 3), "corpus_key": entry["engine"].corpus_key[:12],
+                             "idle_seconds": round(time.time() - entry["last_used"], 1)}
+                for profile_id, entry in reversed(self._entries.items())
+            }
+        return {
+            "loaded": loaded,
+            "resident_mb": round(sum(item["mb"] for item in loaded.values()), 3),
+            "budget_mb": self.budget_bytes / 1e6,
+            "max_loaded": self.max_loaded,
+            "stats": dict(self.stats),
+            "events": list(self.events)[-10:],
+        }
+
+    def prometheus_text(self):
+        """Profile cache metrics, appended to MetricsRegistry.prometheus_text via its collectors."""
+        with self._lock:
+            loaded = len(self._entries)
+            resident = sum(entry["bytes"] for entry in self._entries.values())
+            stats = Counter(self.stats)
+        lines = [
+            "# TYPE portfolio_profiles_loaded gauge",
+            f"portfolio_profiles_loaded {loaded}",
+            "# TYPE portfolio_profile_resident_bytes gauge",
+            f"portfolio_profile_resident_bytes {resident}",
+            "# TYPE portfolio_profile_events_total counter",
+        ]
+        lines += [f'portfolio_profile_events_total{{event="{event}"}} {stats[event + "s"]}'
+                  for event in ("hit", "load", "reload", "eviction", "load_error")]
+        lines.append("# TYPE portfolio_profile_load_seconds_total counter")
+        lines.append(f"portfolio_profile_load_seconds_total {stats['load_seconds']:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+# --- Measurement: lazy loading and eviction over many synthetic profiles ---
+def main():
+    parser = argparse.ArgumentParser(description="Load many synthetic profiles through a bounded ProfileRegistry.")
+    parser.add_argument("--profiles", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--budget-mb", type=float, default=1.0)
+    parser.add_argument("--work-dir", default=os.path.join(CACHE_DIR, "profile-bench"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    folder = os.path.join(args.work_dir, "profiles")
+    os.makedirs(folder, exist_ok=True)
+    for i in range(args.profiles):
+        document = os.path.join(folder, f"p{i}.txt")
+        if not os.path.exists(document):
+            with open(document, "w", encoding="utf-8") as f:
+                f.write("\n".join(f"Person {i} worked on project {j} using tool {(i * j) % 17}." for j in range(400)))
+        with open(os.path.join(folder, f"p{i}.json"), "w", encoding="utf-8") as f:
+            json.dump({"name": f"Person {i}", "documents": [f"p{i}.txt"]}, f)
+
+    llm = FakeStreamingChatModel(first_token_latency=0.0, token_latency=0.0)
+    build_engine = engine_factory(get_embedding_backend(backend="fake:256"), LLMChain(llm=llm, prompt=condense_prompt),
+                                  llm, MetricsRegistry(), cache_dir=args.work_dir)
+    registry = ProfileRegistry(build_engine, folder, budget_mb=args.budget_mb)
+    random.seed(0)
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        # Skewed traffic: a few popular profiles and a long tail.
+        registry.get(f"p{min(int(random.expovariate(0.3)), args.profiles - 1)}")
+    snapshot = registry.snapshot()
+    print(f"{args.requests} requests over {args.profiles} profiles in {time.perf_counter() - started:.1f}s")
+    print(f"stats: {snapshot['stats']}")
+    print(f"resident: {len(snapshot['loaded'])} profiles, {snapshot['resident_mb']} MB (budget {args.budget_mb} MB)")
+
+
+if __name__ == "__main__":
+    main()
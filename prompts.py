@@ -0,0 +1,44 @@
+from langchain.prompts import PromptTemplate
+
+# --- Prompt ---
+# {name} is the profile's person (see profiles/); it defaults to Mahitha.
+custom_prompt = PromptTemplate(
+    input_variables=["chat_history", "context", "question"],
+    partial_variables={"name": "Mahitha"},
+    template="""
+You are an intelligent assistant answering questions about {name}'s resume and personal profile.
+
+Use the extracted context below, **but do not limit yourself to it**.
+If something is not directly stated, make logical inferences based on:
+- Her experience
+- Her listed skills and technologies
+- Personal interests (if mentioned)
+- Standard industry practices
+
+If the question asks for contact information and it's mentioned in the resume, provide it directly.
+
+If the answer cannot be found or reasonably inferred, respond: 
+"This information isn't available in {name}’s professional or personal profile."
+
+Be thoughtful and confident.
+
+Resume Context:
+{context}
+
+Conversation so far:
+{chat_history}
+
+Question: {question}
+Answer:
+"""
+)
+
+condense_prompt = PromptTemplate(
+    input_variables=["chat_history", "question"],
+    template="Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question.\n\nChat History:\n{chat_history}\nFollow Up Input: {question}\nStandalone question:"
+)
+
+summary_prompt = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template="Progressively summarize the conversation about this person's profile, adding onto the previous summary. Keep it under 120 words and keep names, skills and facts that were asked about.\n\nCurrent summary:\n{summary}\n\nNew lines of conversation:\n{new_lines}\n\nNew summary:"
+)
@@ -0,0 +1,226 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+from langchain_core.prompts import format_document
+
+from metrics import annotate, record_llm_call, span
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+_stats_lock = threading.Lock()
+
+# --- Follow-up detection ---
+# A question only needs the condense (rephrase) LLM call when there is prior
+# conversation and it plausibly refers back to it.
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(she|her|hers|herself|he|him|his|they|them|their|it|its|that|this|those|these|there|then|"
+    r"also|too|else|more|same|other|another|above|previous|earlier)\b",
+    re.IGNORECASE,
+)
+SHORT_QUESTION_WORDS = 4  # "and python?", "why?", "what about AWS?"
+
+
+def condense_decision(question, turns):
+    """Return (should_condense, reason) for a question given the session's prior turns."""
+    if not turns:
+        return False, "no_history"
+    if FOLLOW_UP_PATTERN.search(question):
+        return True, "reference"
+    if len(question.split()) <= SHORT_QUESTION_WORDS:
+        return True, "short"
+    return False, "standalone"
+
+
+FALLBACK_TEMPLATE = "This information isn't available in {name}'s professional or personal profile."
+FALLBACK_ANSWER = FALLBACK_TEMPLATE.format(name="Mahitha")
+NON_ANSWERS = ["i don't know.", "i don't have that information.", "not sure.", "i'm not sure."]
+
+
+def normalize_answer(answer, fallback=FALLBACK_ANSWER):
+    """Replace the model's bare "don't know" replies with the profile's fallback answer."""
+    if answer.strip().lower() in NON_ANSWERS:
+        return fallback
+    return answer
+
+
+@asynccontextmanager
+async def _no_limit():
+    yield
+
+
+def format_chat_history(turns):
+    """Render turns for the prompts, led by the summary of older turns when given a memory.ChatHistory."""
+    lines = [f"Summary of earlier conversation: {turns.summary}"] if getattr(turns, "summary", "") else []
+    lines += [f"Human: {question}\nAssistant: {answer}" for question, answer in turns]
+    return "\n".join(lines)
+
+
+class ConversationalQA:
+    """Retrieval QA over a per-session history of (question, answer) turns.
+
+    Mirrors ConversationalRetrievalChain, but only runs the question generator
+    when condense_decision says the question depends on earlier turns. Decisions
+    are counted in `stats` (pass a shared Counter to aggregate across sessions)
+    so the saved LLM round-trips can be measured. An optional ContextAssembler
+    trims the retrieved chunks before they are stuffed into the prompt.
+    """
+
+    def __init__(self, retriever, question_generator, combine_docs_chain, stats=None, assembler=None):
+        self.retriever = retriever
+        self.question_generator = question_generator
+        self.combine_docs_chain = combine_docs_chain
+        self.stats = Counter() if stats is None else stats
+        self.assembler = assembler
+
+    def _decide(self, question, turns):
+        should_condense, reason = condense_decision(question, turns)
+        with _stats_lock:
+            self.stats["condensed" if should_condense else "skipped"] += 1
+            self.stats[f"reason:{reason}"] += 1
+        logger.info("condense=%s reason=%s", should_condense, reason)
+        annotate("condense", reason)
+        return should_condense, reason
+
+    def condense(self, question, turns):
+        should_condense, reason = self._decide(question, turns)
+        if not should_condense:
+            return question, reason
+        inputs = {"question": question, "chat_history": format_chat_history(turns)}
+        with span("condense"):
+            result = self.question_generator.invoke(inputs)
+        standalone_question = result[self.question_generator.output_key].strip()
+        record_llm_call(
+            count_tokens(self.question_generator.prompt.format(**inputs)), count_tokens(standalone_question)
+        )
+        return standalone_question, reason
+
+    async def acondense(self, question, turns, limiter=None):
+        """Async condense; `limiter` (e.g. an asyncio.Semaphore) bounds concurrent LLM calls."""
+        should_condense, reason = self._decide(question, turns)
+        if not should_condense:
+            return question, reason
+        inputs = {"question": question, "chat_history": format_chat_history(turns)}
+        async with limiter or _no_limit():
+            with span("condense"):
+                result = await self.question_generator.ainvoke(inputs)
+        standalone_question = result[self.question_generator.output_key].strip()
+        record_llm_call(
+            count_tokens(self.question_generator.prompt.format(**inputs)), count_tokens(standalone_question)
+        )
+        return standalone_question, reason
+
+    async def aanswer(self, question, turns, limiter=None, vector=None):
+        with span("retrieve"):
+            documents = await self.retriever.ainvoke(question, vector=vector)
+        documents = self._pack(documents)
+        prompt = self.build_prompt(question, documents, turns)
+        async with limiter or _no_limit():
+            with span("generate"):
+                message = await self.combine_docs_chain.llm_chain.llm.ainvoke(prompt)
+        record_llm_call(count_tokens(prompt), count_tokens(message.content))
+        return message.content, documents
+
+    def _pack(self, documents):
+        if self.assembler is None:
+            return documents
+        with span("pack"):
+            documents, report = self.assembler.assemble(documents)
+        annotate("context_tokens_saved", report["tokens_saved"])
+        return documents
+
+    def retrieve(self, question, vector=None):
+        """Retrieved (and packed) chunks; pass `vector` if the question is already embedded."""
+        with span("retrieve"):
+            documents = self.retriever.invoke(question, vector=vector)
+        return self._pack(documents)
+
+    def answer(self, question, turns, vector=None):
+        documents = self.retrieve(question, vector)
+        with span("generate"):
+            result = self.combine_docs_chain.invoke({
+                "input_documents": documents,
+                "question": question,
+                "chat_history": format_chat_history(turns),
+            })
+        answer = result[self.combine_docs_chain.output_key]
+        record_llm_call(count_tokens(self.build_prompt(question, documents, turns)), count_tokens(answer))
+        return answer, documents
+
+    def build_prompt(self, question, documents, turns):
+        """Render the stuff chain's prompt exactly as StuffDocumentsChain would."""
+        chain = self.combine_docs_chain
+        context = chain.document_separator.join(
+            format_document(document, chain.document_prompt) for document in documents
+        )
+        return chain.llm_chain.prompt.format(**{
+            chain.document_variable_name: context,
+            "question": question,
+            "chat_history": format_chat_history(turns),
+        })
+
+    def stream_answer(self, question, turns, vector=None):
+        """Retrieve now and return a generator of answer tokens from the chain's LLM."""
+        documents = self.retrieve(question, vector)
+        return self.stream_prompt(self.build_prompt(question, documents, turns))
+
+    def stream_prompt(self, prompt):
+        parts = []
+        with span("generate"):
+            for chunk in self.combine_docs_chain.llm_chain.llm.stream(prompt):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+        record_llm_call(count_tokens(prompt), count_tokens("".join(parts)))
+
+    def invoke(self, question, turns):
+        standalone_question, reason = self.condense(question, turns)
+        answer, documents = self.answer(standalone_question, turns)
+        return {
+            "answer": answer,
+            "source_documents": documents,
+            "standalone_question": standalone_question,
+            "condense_reason": reason,
+        }
+
+
+# --- Streaming latency ---
+def percentile(values, q):
+    """Nearest-rank percentile, or None for no values."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class StreamTimings:
+    """Rolling record of time-to-first-token and total stream time, in seconds."""
+
+    def __init__(self, maxlen=1000):
+        self.first_token = deque(maxlen=maxlen)
+        self.total = deque(maxlen=maxlen)
+
+    def summary(self):
+        return {
+            "count": len(self.total),
+            "ttft_p50": percentile(self.first_token, 50),
+            "ttft_p95": percentile(self.first_token, 95),
+            "total_p50": percentile(self.total, 50),
+        }
+
+
+def timed_stream(tokens, timings, started=None):
+    """Pass tokens through while recording time-to-first-token from `started`."""
+    started = time.perf_counter() if started is None else started
+    first = None
+    for token in tokens:
+        if first is None:
+            first = time.perf_counter() - started
+            timings.first_token.append(first)
+            annotate("time_to_first_token_ms", first * 1000)
+            logger.info("time_to_first_token=%.3fs", first)
+        yield token
+    timings.total.append(time.perf_counter() - started)
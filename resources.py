@@ -0,0 +1,189 @@
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+import httpx
+from langchain.chains import LLMChain
+from langchain.chains.combine_documents.stuff import StuffDocumentsChain
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from fakes import FakeEmbeddings, FakeStreamingChatModel
+from local_embeddings import HashedNgramEmbeddings, StaticVectorEmbeddings
+from prompts import condense_prompt, custom_prompt, summary_prompt
+
+logger = logging.getLogger(__name__)
+
+# --- Process-wide resources ---
+# Clients, models and chains are built once per process and shared by every
+# Streamlit session, so HTTP keep-alive connections survive across reruns.
+CHAT_MODEL = "gpt-3.5-turbo"
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=120.0)
+
+resource_stats = {
+    "builds": Counter(),  # factory name -> times constructed
+    "hits": Counter(),  # factory name -> times served from the cache
+    "build_seconds": Counter(),  # factory name -> total construction time
+}
+http_stats = Counter()  # requests, tcp_connects, tls_handshakes
+_resources = {}
+_lock = threading.RLock()  # held while building, so one thread builds each resource
+_http_stats_lock = threading.Lock()  # the request hooks run on every thread using a client
+
+
+def resource(factory):
+    """Cache a factory's result per normalized arguments for the lifetime of the process.
+
+    Positional, keyword and defaulted arguments are bound to the factory's
+    signature, so get_llm(key) and get_llm(key, model_name=CHAT_MODEL) share one instance.
+    """
+    signature = inspect.signature(factory)
+
+    @wraps(factory)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (factory.__name__,) + tuple(bound.arguments.items())
+        with _lock:
+            if key in _resources:
+                resource_stats["hits"][factory.__name__] += 1
+                return _resources[key]
+            started = time.perf_counter()
+            value = factory(*bound.args, **bound.kwargs)
+            elapsed = time.perf_counter() - started
+            resource_stats["builds"][factory.__name__] += 1
+            resource_stats["build_seconds"][factory.__name__] += elapsed
+            logger.info("built %s in %.3fs", factory.__name__, elapsed)
+            _resources[key] = value
+            return value
+
+    return wrapper
+
+
+def construction_seconds_saved():
+    """Estimated construction time avoided by serving cached resources instead of rebuilding."""
+    saved = 0.0
+    with _lock:
+        for name, hits in resource_stats["hits"].items():
+            builds = resource_stats["builds"][name]
+            if builds:
+                saved += hits * resource_stats["build_seconds"][name] / builds
+    return saved
+
+
+# --- Pooled HTTP clients with connection tracing ---
+def _count(name):
+    with _http_stats_lock:
+        http_stats[name] += 1
+
+
+def _record(event_name):
+    if event_name == "connection.connect_tcp.complete":
+        _count("tcp_connects")
+    elif event_name == "connection.start_tls.complete":
+        _count("tls_handshakes")
+
+
+def _trace(event_name, info):
+    _record(event_name)
+
+
+async def _atrace(event_name, info):
+    _record(event_name)
+
+
+def _on_request(request):
+    _count("requests")
+    request.extensions["trace"] = _trace
+
+
+async def _aon_request(request):
+    _count("requests")
+    request.extensions["trace"] = _atrace
+
+
+@resource
+def get_http_client():
+    return httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, event_hooks={"request": [_on_request]})
+
+
+@resource
+def get_async_http_client():
+    return httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, event_hooks={"request": [_aon_request]})
+
+
+def connection_stats():
+    """HTTP requests made versus new connections opened; the difference is reused keep-alive."""
+    with _http_stats_lock:
+        stats = dict(http_stats)
+    stats["handshakes_saved"] = stats.get("requests", 0) - stats.get("tls_handshakes", 0)
+    return stats
+
+
+# --- Models and chains ---
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "openai")  # openai, hashing, static:<path.npz> or fake
+FAKE_EMBEDDING_SIZE = 1536
+
+
+@resource
+def get_embedding_backend(api_key=None, backend=EMBEDDING_BACKEND):
+    """Return the embedder selected by EMBEDDING_BACKEND; the local ones need no API key or network.
+
+    `fake[:<size>]` gives deterministic random vectors for offline runs; retrieval quality is meaningless.
+    """
+    if backend == "openai":
+        return get_embeddings(api_key)
+    if backend == "hashing":
+        return HashedNgramEmbeddings()
+    if backend.startswith("static:"):
+        return StaticVectorEmbeddings(backend.split(":", 1)[1])
+    if backend == "fake" or backend.startswith("fake:"):
+        return FakeEmbeddings(size=int(backend.split(":", 1)[1]) if ":" in backend else FAKE_EMBEDDING_SIZE)
+    raise ValueError(f"Unknown embedding backend {backend!r}; use openai, hashing, static:<path.npz> or fake.")
+
+
+@resource
+def get_embeddings(api_key):
+    return OpenAIEmbeddings(
+        openai_api_key=api_key,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+
+
+@resource
+def get_llm(api_key, model_name=CHAT_MODEL):
+    if os.environ.get("FAKE_LLM"):
+        # Offline mode: stream a canned answer with simulated latency.
+        return FakeStreamingChatModel()
+    return ChatOpenAI(
+        openai_api_key=api_key,
+        model_name=model_name,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+
+
+def build_stuff_chain(llm, prompt=custom_prompt):
+    return StuffDocumentsChain(
+        llm_chain=LLMChain(llm=llm, prompt=prompt),
+        document_variable_name="context"
+    )
+
+
+@resource
+def get_chains(api_key, model_name=CHAT_MODEL):
+    """Return (question_generator, stuff_chain) sharing one LLM."""
+    llm = get_llm(api_key, model_name)
+    question_generator = LLMChain(llm=llm, prompt=condense_prompt)
+    return question_generator, build_stuff_chain(llm)
+
+
+@resource
+def get_summarizer(api_key, model_name=CHAT_MODEL):
+    """LLMChain that folds old turns into a session's rolling summary (see memory.py)."""
+    return LLMChain(llm=get_llm(api_key, model_name), prompt=summary_prompt)
@@ -0,0 +1,277 @@
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from pydantic import Field
+
+from index_cache import CACHE_DIR, index_dir
+from metrics import annotate, span
+from resources import get_embedding_backend
+
+# --- Lexical index (BM25) ---
+# Built at ingest time over the same chunks as the FAISS index and saved next
+# to it as bm25.json, so exact tokens (certification names, tools, acronyms)
+# can be matched without a query-embedding round trip.
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*(?:[.\-][a-z0-9+#]+)*")
+STOPWORDS = frozenset(
+    "a about an and any are as at be been by can could did do does for from has have her hers "
+    "herself how i in is it its know me mahitha mahitha's my of on or she so tell that the their "
+    "them there this to was what when where which who why will with would you your".split()
+)
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_FILE = "bm25.json"
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over chunk texts with an inverted index of term -> [(doc, tf)]."""
+
+    def __init__(self, ids, lengths, postings, k1=BM25_K1, b=BM25_B):
+        self.ids = ids
+        self.lengths = lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.average_length = sum(lengths) / len(lengths) if lengths else 0.0
+        total = len(ids)
+        self.idf = {
+            term: math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+
+    @classmethod
+    def build(cls, ids, texts, k1=BM25_K1, b=BM25_B):
+        postings = defaultdict(list)
+        lengths = []
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc, tf))
+        return cls(list(ids), lengths, dict(postings), k1, b)
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "lengths": self.lengths, "postings": self.postings,
+                       "k1": self.k1, "b": self.b}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {term: [tuple(p) for p in docs] for term, docs in data["postings"].items()}
+        return cls(data["ids"], data["lengths"], postings, data["k1"], data["b"])
+
+    def search(self, query, k=10):
+        """Return up to k (doc id, score, matched query terms) triples, best first."""
+        terms = set(tokenize(query))
+        scores = defaultdict(float)
+        matched = defaultdict(set)
+        for term in terms:
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.lengths[doc] / (self.average_length or 1.0)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+                matched[doc].add(term)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [(self.ids[doc], scores[doc], matched[doc]) for doc in ranked]
+
+    def known_terms(self, query):
+        return {term for term in tokenize(query) if term in self.idf}
+
+
+# --- Hybrid retriever ---
+RRF_K = 60  # reciprocal rank fusion constant
+LEXICAL_MIN_SCORE = 4.0  # BM25 score the top hit needs for the lexical-only fast path
+LEXICAL_MARGIN = 1.3  # and how far it must lead the runner-up
+_stats_lock = threading.Lock()  # retrievers are shared by every session of an engine
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 + FAISS retrieval fused with reciprocal rank fusion.
+
+    When BM25 is confident (the top chunk contains every known query term,
+    scores above LEXICAL_MIN_SCORE and leads the runner-up by LEXICAL_MARGIN)
+    the vector search, and with it the query-embedding call, is skipped.
+    Callers that already embedded the query can pass it as `vector=`.
+    """
+
+    vectorstore: VectorStore
+    bm25: BM25Index
+    k: int = 6
+    fetch_k: int = 20
+    rrf_k: int = RRF_K
+    lexical_min_score: float = LEXICAL_MIN_SCORE
+    lexical_margin: float = LEXICAL_MARGIN
+    lexical_fast_path: bool = True
+    stats: Counter = Field(default_factory=Counter)
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def lexical_confident(self, query, hits):
+        if not hits or hits[0][1] < self.lexical_min_score:
+            return False
+        known = self.bm25.known_terms(query)
+        if not known or hits[0][2] != known:
+            return False
+        return len(hits) == 1 or hits[0][1] >= self.lexical_margin * hits[1][1]
+
+    def _documents(self, ids):
+        documents = []
+        for doc_id in ids:
+            document = self.vectorstore.docstore.search(doc_id)
+            if isinstance(document, Document):
+                documents.append(document)
+        return documents
+
+    def _lexical(self, query):
+        """Return (BM25 hits, documents if the lexical fast path applies else None)."""
+        with span("bm25_search"):
+            hits = self.bm25.search(query, self.fetch_k)
+        if self.lexical_fast_path and self.lexical_confident(query, hits):
+            with _stats_lock:
+                self.stats["lexical"] += 1
+            annotate("retrieval", "lexical")
+            return hits, self._documents([doc_id for doc_id, _, _ in hits[:self.k]])
+        with _stats_lock:
+            self.stats["hybrid"] += 1
+        annotate("retrieval", "hybrid")
+        return hits, None
+
+    def _fuse(self, hits, vector):
+        if len(vector) != self.vectorstore.index.d:
+            raise ValueError(
+                f"Query embedding has {len(vector)} dimensions but the index has {self.vectorstore.index.d}; "
+                "it was built with a different embedding backend."
+            )
+        with span("faiss_search"):
+            vector_ids = [
+                document.metadata.get("chunk_id")
+                for document in self.vectorstore.similarity_search_by_vector(vector, k=self.fetch_k)
+            ]
+        fused = reciprocal_rank_fusion(
+            [[doc_id for doc_id, _, _ in hits], [i for i in vector_ids if i]], self.rrf_k
+        )
+        return self._documents(fused[:self.k])
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun, vector=None):
+        hits, documents = self._lexical(query)
+        if documents is not None:
+            return documents
+        if vector is None:
+            with span("embed_query"):
+                vector = self.vectorstore.embeddings.embed_query(query)
+        return self._fuse(hits, vector)
+
+    async def _aget_relevant_documents(self, query, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       vector=None):
+        hits, documents = self._lexical(query)
+        if documents is not None:
+            return documents
+        if vector is None:
+            with span("embed_query"):
+                vector = await self.vectorstore.embeddings.aembed_query(query)
+        return self._fuse(hits, vector)
+
+
+def build_bm25(documents):
+    return BM25Index.build([d.metadata["chunk_id"] for d in documents], [d.page_content for d in documents])
+
+
+def bm25_path(folder):
+    return os.path.join(folder, BM25_FILE)
+
+
+def load_bm25(folder, vectorstore=None):
+    """Load bm25.json, or rebuild it from the vector store's docstore if it is missing."""
+    path = bm25_path(folder)
+    if os.path.exists(path):
+        return BM25Index.load(path)
+    if vectorstore is None:
+        return None
+    documents = [vectorstore.docstore.search(i) for i in vectorstore.index_to_docstore_id.values()]
+    bm25 = build_bm25([d for d in documents if isinstance(d, Document)])
+    bm25.save(path)
+    return bm25
+
+
+# --- Benchmark: FAISS-only vs hybrid ---
+EVAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_eval.json")
+
+
+def covers_expected(documents, expected):
+    text = " ".join(d.page_content.lower() for d in documents)
+    return all(term.lower() in text for term in expected)
+
+
+def benchmark(retrievers, examples, repeat=3):
+    """Hit rate (all expected terms retrieved) and mean latency per retriever."""
+    report = {}
+    for name, retriever in retrievers.items():
+        hits, elapsed = 0, 0.0
+        for example in examples:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                documents = retriever.invoke(example["question"])
+                elapsed += time.perf_counter() - started
+            hits += covers_expected(documents, example["expect"])
+        report[name] = {
+            "hit_rate": hits / len(examples),
+            "mean_ms": elapsed / (len(examples) * repeat) * 1000,
+        }
+    return report
+
+
+def main():
+    # ingest imports this module to build the BM25 index, so import it lazily here.
+    from ingest import DOCUMENT_PATHS, load_or_build_index
+
+    parser = argparse.ArgumentParser(description="Compare FAISS-only and hybrid retrieval.")
+    parser.add_argument("--examples", default=EVAL_PATH)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    load_dotenv()
+    embedding = get_embedding_backend()
+    vectorstore, _ = load_or_build_index(embedding, DOCUMENT_PATHS, cache_dir=args.cache_dir)
+    bm25 = load_bm25(index_dir(args.cache_dir), vectorstore)
+    with open(args.examples, encoding="utf-8") as f:
+        examples = json.load(f)
+    hybrid = HybridRetriever(vectorstore=vectorstore, bm25=bm25)
+    report = benchmark({
+        "faiss": vectorstore.as_retriever(search_kwargs={"k": 6}),
+        "hybrid": hybrid,
+    }, examples)
+    for name, scores in report.items():
+        print(f"{name:>7}: hit rate {scores['hit_rate']:.2f}  mean {scores['mean_ms']:.1f} ms/query")
+    print(f"hybrid routes: {dict(hybrid.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from local_embeddings import unit_rows
+from metrics import annotate, span
+
+# --- Intent routing ---
+# Canned answers are declared in intents.json. All intent patterns are compiled
+# into one word-bounded regex with a named group per intent, so routing is a
+# single pass over the query no matter how many intents there are.
+INTENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents.json")
+EVAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents_eval.json")
+SEMANTIC_THRESHOLD = 0.88  # cosine similarity to an exemplar needed for the embedding tier
+
+
+def compile_intents(intents):
+    groups = []
+    for intent in intents:
+        if not re.fullmatch(r"[A-Za-z_]\w*", intent["name"]):
+            raise ValueError(f"Intent name {intent['name']!r} must be a valid identifier.")
+        alternatives = "|".join(f"(?:{pattern})" for pattern in intent["patterns"])
+        groups.append(f"(?P<{intent['name']}>\\b(?:{alternatives})\\b)")
+    # With no intents, match nothing rather than the empty pattern's everything.
+    return re.compile("|".join(groups) or "(?!)", re.IGNORECASE)
+
+
+class IntentRouter:
+    """Route questions to canned answers without an LLM call.
+
+    Tier 1 is the compiled regex. Tier 2 (only when an embedder is supplied)
+    compares the question with each intent's exemplar questions by cosine
+    similarity.
+    """
+
+    def __init__(self, intents, embedding=None, threshold=SEMANTIC_THRESHOLD):
+        self.intents = {intent["name"]: intent for intent in intents}
+        self.pattern = compile_intents(intents)
+        self.embedding = embedding
+        self.threshold = threshold
+        self.stats = Counter()
+        self._exemplar_names = []
+        self._exemplar_matrix = None
+        if embedding is not None:
+            exemplars = [(i["name"], text) for i in intents for text in i.get("exemplars", [])]
+            if exemplars:
+                self._exemplar_names = [name for name, _ in exemplars]
+                self._exemplar_matrix = unit_rows(embedding.embed_documents([text for _, text in exemplars]))
+
+    @classmethod
+    def from_file(cls, path=INTENTS_PATH, embedding=None, threshold=SEMANTIC_THRESHOLD):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["intents"], embedding, threshold)
+
+    def match(self, query):
+        """Return (intent name, tier) or (None, None)."""
+        found = self.pattern.search(query)
+        if found:
+            return found.lastgroup, "pattern"
+        if self._exemplar_matrix is not None:
+            vector = unit_rows([self.embedding.embed_query(query)])[0]
+            scores = self._exemplar_matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self._exemplar_names[best], "semantic"
+        return None, None
+
+    def route(self, query):
+        """Return the canned answer for a query, or None if it should go to the LLM."""
+        with span("route"):
+            name, tier = self.match(query)
+        self.stats[tier or "llm"] += 1
+        if name is None:
+            return None
+        annotate("intent", name)
+        annotate("intent_tier", tier)
+        return self.intents[name]["answer"]
+
+
+# --- Evaluation and benchmark ---
+def evaluate(router, examples):
+    """Per-intent precision and recall over labelled examples of {"query", "intent"}."""
+    counts = {name: Counter() for name in router.intents}
+    errors = []
+    for example in examples:
+        predicted, _ = router.match(example["query"])
+        expected = example["intent"]
+        if predicted == expected:
+            if expected is not None:
+                counts[expected]["tp"] += 1
+            continue
+        errors.append((example["query"], expected, predicted))
+        if predicted is not None:
+            counts[predicted]["fp"] += 1
+        if expected is not None:
+            counts[expected]["fn"] += 1
+    report = {}
+    for name, c in counts.items():
+        report[name] = {
+            "precision": c["tp"] / (c["tp"] + c["fp"]) if c["tp"] + c["fp"] else 1.0,
+            "recall": c["tp"] / (c["tp"] + c["fn"]) if c["tp"] + c["fn"] else 1.0,
+        }
+    return report, errors
+
+
+def benchmark(router, queries, repeat=200):
+    """Mean routing latency per query in microseconds."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            router.match(query)
+    return (time.perf_counter() - started) / (repeat * len(queries)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate and benchmark the intent router.")
+    parser.add_argument("--intents", default=INTENTS_PATH)
+    parser.add_argument("--examples", default=EVAL_PATH)
+    args = parser.parse_args()
+
+    router = IntentRouter.from_file(args.intents)
+    with open(args.examples, encoding="utf-8") as f:
+        examples = json.load(f)
+    report, errors = evaluate(router, examples)
+    for name, scores in report.items():
+        print(f"{name:>12}: precision {scores['precision']:.2f}  recall {scores['recall']:.2f}")
+    for query, expected, predicted in errors:
+        print(f"  miss: {query!r} expected={expected} got={predicted}")
+    latency = benchmark(router, [e["query"] for e in examples])
+    print(f"routing latency: {latency:.1f} us/query over {len(examples)} queries")
+    if errors:
+        sys.exit(f"{len(errors)} of {len(examples)} examples misrouted")
+
+
+if __name__ == "__main__":
+    main()
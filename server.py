@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+import tornado.web
+from dotenv import load_dotenv
+
+from engine import MAX_LLM_CALLS
+from index_cache import CACHE_DIR
+from memory import bound_turns
+from metrics import MetricsRegistry
+from profiles import DEFAULT_PROFILE, ProfileRegistry, engine_factory
+from resources import connection_stats, get_chains, get_embedding_backend, get_llm
+
+logger = logging.getLogger(__name__)
+
+# --- Async HTTP API for the QA engine ---
+# One event loop serves every request: retrieval embeddings and LLM calls go
+# through the pooled async clients in resources.py, so a single core can hold
+# many concurrent conversations. Point OPENAI_BASE_URL at an OpenAI-compatible
+# stub to load-test without the real API. Requests pick a portfolio with a
+# "profile" field or ?profile=<id> (see profiles.py).
+MAX_QUESTION_CHARS = 2000
+MAX_HISTORY_TURNS = 50  # accepted per request, before the token budget is applied
+
+
+async def get_engine(profiles, profile_id):
+    """The profile's engine, looked up off the event loop.
+
+    Even a loaded profile goes through a thread: get() checks the corpus
+    fingerprint and rebuilds the engine when the documents changed.
+    """
+    try:
+        return (await asyncio.to_thread(profiles.get, profile_id))[1]
+    except KeyError:
+        raise tornado.web.HTTPError(404, reason=f"unknown profile {profile_id!r}")
+
+
+class AskHandler(tornado.web.RequestHandler):
+    """POST {"question": str, "history": [[q, a], ...], "profile": str} -> {"answer", "route", "trace_id"}."""
+
+    def initialize(self, profiles):
+        self.profiles = profiles
+
+    async def post(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+            profile_id = str(body.get("profile") or self.get_query_argument("profile", DEFAULT_PROFILE))
+            question = body["question"].strip()
+            # The API is stateless, so long histories are cut to the same budget the app keeps verbatim.
+            _, turns = bound_turns([(str(q), str(a)) for q, a in body.get("history", [])[-MAX_HISTORY_TURNS:]])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise tornado.web.HTTPError(400, reason="expected {\"question\": str, \"history\": [[q, a], ...]}")
+        if not question or len(question) > MAX_QUESTION_CHARS:
+            raise tornado.web.HTTPError(400, reason=f"question must be 1-{MAX_QUESTION_CHARS} characters")
+        engine = await get_engine(self.profiles, profile_id)
+        answer, trace = await engine.aask(question, turns)
+        self.write({"answer": answer, "route": trace.route, "trace_id": trace.id})
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, registry):
+        self.registry = registry
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(self.registry.prometheus_text())
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    """Profile cache state; with ?profile=<id>, also that profile's engine counters (without loading it)."""
+
+    def initialize(self, profiles):
+        self.profiles = profiles
+
+    def get(self):
+        stats = {"profiles": self.profiles.snapshot(), "connections": connection_stats()}
+        engine = self.profiles.peek(self.get_query_argument("profile", ""))
+        if engine is not None:
+            stats["engine"] = engine.snapshot()
+        self.write(stats)
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write({"status": "ok"})
+
+
+def make_app(profiles, registry):
+    return tornado.web.Application([
+        (r"/ask", AskHandler, {"profiles": profiles}),
+        (r"/metrics", MetricsHandler, {"registry": registry}),
+        (r"/stats", StatsHandler, {"profiles": profiles}),
+        (r"/healthz", HealthHandler),
+    ])
+
+
+async def serve(profiles, registry, host, port):
+    make_app(profiles, registry).listen(port, address=host)
+    logger.info("serving on http://%s:%d", host, port)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the portfolio QA engine over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-llm-calls", type=int, default=MAX_LLM_CALLS, help="LLM requests in flight, all profiles")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    api_key = os.environ.get("OPENAI_API_KEY", "")
+    embedding = get_embedding_backend(api_key)
+    question_generator, _ = get_chains(api_key)
+    registry = MetricsRegistry(log_path=os.environ.get("METRICS_LOG"))
+    # One limiter shared by every profile's engine keeps --max-llm-calls process-wide.
+    build_engine = engine_factory(embedding, question_generator, get_llm(api_key), registry, cache_dir=args.cache_dir,
+                                  max_llm_calls=args.max_llm_calls, llm_limiter=asyncio.Semaphore(args.max_llm_calls))
+    profiles = ProfileRegistry(build_engine)
+    registry.collectors.append(profiles.prometheus_text)
+    profiles.get(DEFAULT_PROFILE)  # load the default profile before accepting requests
+    asyncio.run(serve(profiles, registry, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import logging
+from functools import lru_cache
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# --- Local token counting (no API calls) ---
+DEFAULT_ENCODING = "cl100k_base"  # gpt-3.5-turbo and the OpenAI embedding models
+CHARS_PER_TOKEN = 4  # rough estimate used when the encoding files are unavailable
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name=DEFAULT_ENCODING):
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        # tiktoken downloads encodings on first use; offline hosts fall back to an estimate.
+        logger.warning("tiktoken encoding %s unavailable, estimating token counts", name)
+        return None
+
+
+def count_tokens(text, encoding=DEFAULT_ENCODING):
+    enc = get_encoding(encoding)
+    if enc is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(enc.encode(text, disallowed_special=()))